@@ -1,7 +1,9 @@
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 import re
+import threading
 
-from app_config import get_app_config
+from app_config import get_app_config, get_app_config_revision
 from tools.base import Tool
 
 PROMPT_MODULE_ORDER = [
@@ -29,6 +31,13 @@ PROMPT_MODULE_TITLES = {
 }
 
 _TEMPLATE_PATTERN = re.compile(r"\{\{\s*([a-zA-Z0-9_.-]+)\s*\}\}")
+PROMPT_CACHE_MAX_ENTRIES = 64
+
+# Key -> (prompt, tools, resolved profile id, ability ids). Keys hold the Tool objects themselves,
+# so a re-registered tool (new object) never matches a stale entry.
+_PROMPT_CACHE: "OrderedDict[Tuple[Any, ...], Tuple[str, Tuple[Tool, ...], Optional[str], Tuple[str, ...]]]" = OrderedDict()
+# Callers run both on the event loop and in worker threads (sync routes, subagents).
+_PROMPT_CACHE_LOCK = threading.Lock()
 
 
 def _as_list(value: Any) -> List[Any]:
@@ -254,6 +263,59 @@ def build_agent_prompt_and_tools(
     include_tools: bool = True,
     extra_context: Optional[Dict[str, Any]] = None,
     exclude_ability_ids: Optional[List[str]] = None
+) -> Tuple[str, List[Tool], Optional[str], List[str]]:
+    cache_key = _prompt_cache_key(profile_id, all_tools, include_tools, extra_context, exclude_ability_ids)
+    cached = None
+    if cache_key is not None:
+        with _PROMPT_CACHE_LOCK:
+            cached = _PROMPT_CACHE.get(cache_key)
+            if cached is not None:
+                _PROMPT_CACHE.move_to_end(cache_key)
+    if cached is not None:
+        prompt, tools, resolved_id, ability_ids = cached
+        return prompt, list(tools), resolved_id, list(ability_ids)
+
+    prompt, tools, resolved_id, ability_ids = _build_agent_prompt_and_tools(
+        profile_id, all_tools, include_tools, extra_context, exclude_ability_ids
+    )
+    if cache_key is not None:
+        with _PROMPT_CACHE_LOCK:
+            _PROMPT_CACHE[cache_key] = (prompt, tuple(tools), resolved_id, tuple(ability_ids))
+            if len(_PROMPT_CACHE) > PROMPT_CACHE_MAX_ENTRIES:
+                _PROMPT_CACHE.popitem(last=False)
+    return prompt, tools, resolved_id, ability_ids
+
+
+def _prompt_cache_key(
+    profile_id: Optional[str],
+    all_tools: List[Tool],
+    include_tools: bool,
+    extra_context: Optional[Dict[str, Any]],
+    exclude_ability_ids: Optional[List[str]]
+) -> Optional[Tuple[Any, ...]]:
+    """Everything the prompt depends on, or None when extra_context is not hashable."""
+    try:
+        extra = tuple(sorted(extra_context.items())) if isinstance(extra_context, dict) else None
+        key = (
+            get_app_config_revision(),
+            profile_id,
+            bool(include_tools),
+            tuple(all_tools),
+            extra,
+            frozenset(str(item) for item in (exclude_ability_ids or []) if item)
+        )
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _build_agent_prompt_and_tools(
+    profile_id: Optional[str],
+    all_tools: List[Tool],
+    include_tools: bool,
+    extra_context: Optional[Dict[str, Any]],
+    exclude_ability_ids: Optional[List[str]]
 ) -> Tuple[str, List[Tool], Optional[str], List[str]]:
     agent_config = _as_dict(get_app_config().get("agent"))
     profile, resolved_id = _resolve_profile(agent_config, profile_id)
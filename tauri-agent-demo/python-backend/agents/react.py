@@ -21,7 +21,7 @@ from tools.base import Tool, tool_to_openai_function, tool_to_openai_responses_t
 from tools.config import get_tool_config
 from context_estimate import build_context_estimate
 from llm_client import LLMTransientError
-from app_config import get_app_config
+from app_config import get_context_config
 from database import db
 from mcp_tools import build_mcp_tool_name, persist_mcp_tool_approval, safe_mcp_tool_name
 from tools.mcp_tool import MCPTool
@@ -394,14 +394,10 @@ class ReActAgent(AgentStrategy):
             if current_turn_compresses >= 3:
                 return None
 
-            app_config = get_app_config()
-            context_cfg = app_config.get("context", {}) if isinstance(app_config, dict) else {}
-            if not context_cfg.get("compression_enabled"):
+            context_cfg = get_context_config()
+            if not context_cfg.compression_enabled:
                 return None
-            try:
-                start_pct = int(context_cfg.get("compress_start_pct", 75))
-            except (TypeError, ValueError):
-                start_pct = 75
+            start_pct = context_cfg.compress_start_pct
 
             max_tokens = getattr(llm_client.config, "max_context_tokens", 0) or 0
             if max_tokens <= 0:
@@ -411,9 +407,9 @@ class ReActAgent(AgentStrategy):
 
             summary_trunc_cfg = {
                 "enabled": True,
-                "threshold": int(context_cfg.get("long_data_threshold", 2000) or 2000),
-                "head_chars": int(context_cfg.get("long_data_head_chars", 600) or 600),
-                "tail_chars": int(context_cfg.get("long_data_tail_chars", 400) or 400)
+                "threshold": context_cfg.long_data_threshold or 2000,
+                "head_chars": context_cfg.long_data_head_chars or 600,
+                "tail_chars": context_cfg.long_data_tail_chars or 400
             }
             summary_messages: List[Dict[str, Any]] = []
             for msg in dynamic_messages:
@@ -507,11 +503,9 @@ class ReActAgent(AgentStrategy):
             if not session_id or not current_user_message_id:
                 return False, None
 
-            app_config = get_app_config()
             updated_summary, updated_call_id, updated_message_id, did_compress = await maybe_compress_context(
                 session_id=session_id,
                 config=llm_client.config,
-                app_config=app_config,
                 llm_client=llm_client,
                 current_summary=context_summary,
                 last_compressed_call_id=last_compressed_call_id,
@@ -570,14 +564,10 @@ class ReActAgent(AgentStrategy):
             if current_turn_compresses >= 3:
                 return None
 
-            app_config = get_app_config()
-            context_cfg = app_config.get("context", {}) if isinstance(app_config, dict) else {}
-            if not context_cfg.get("compression_enabled"):
+            context_cfg = get_context_config()
+            if not context_cfg.compression_enabled:
                 return None
-            try:
-                start_pct = int(context_cfg.get("compress_start_pct", 75))
-            except (TypeError, ValueError):
-                start_pct = 75
+            start_pct = context_cfg.compress_start_pct
 
             max_tokens = getattr(llm_client.config, "max_context_tokens", 0) or 0
             if max_tokens <= 0:
@@ -587,9 +577,9 @@ class ReActAgent(AgentStrategy):
 
             summary_trunc_cfg = {
                 "enabled": True,
-                "threshold": int(context_cfg.get("long_data_threshold", 2000) or 2000),
-                "head_chars": int(context_cfg.get("long_data_head_chars", 600) or 600),
-                "tail_chars": int(context_cfg.get("long_data_tail_chars", 400) or 400)
+                "threshold": context_cfg.long_data_threshold or 2000,
+                "head_chars": context_cfg.long_data_head_chars or 600,
+                "tail_chars": context_cfg.long_data_tail_chars or 400
             }
             summary_messages: List[Dict[str, Any]] = []
             for msg in dynamic_messages:
@@ -1522,11 +1512,9 @@ class ReActAgent(AgentStrategy):
             if not session_id or not current_user_message_id:
                 return False, None
 
-            app_config = get_app_config()
             updated_summary, updated_call_id, updated_message_id, did_compress = await maybe_compress_context(
                 session_id=session_id,
                 config=llm_client.config,
-                app_config=app_config,
                 llm_client=llm_client,
                 current_summary=context_summary,
                 last_compressed_call_id=last_compressed_call_id,
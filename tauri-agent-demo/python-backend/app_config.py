@@ -1,6 +1,7 @@
 import json
 import os
 import copy
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Optional
 
@@ -534,14 +535,115 @@ def _load_config() -> Dict[str, Any]:
 _APP_CONFIG = _load_config()
 
 
+@dataclass(frozen=True)
+class ContextConfig:
+    compression_enabled: bool = False
+    compress_start_pct: int = 75
+    compress_target_pct: int = 55
+    min_keep_messages: int = 1
+    keep_recent_calls: int = 10
+    step_calls: int = 5
+    truncate_long_data: bool = True
+    long_data_threshold: int = 4000
+    long_data_head_chars: int = 1200
+    long_data_tail_chars: int = 800
+
+    def truncation_cfg(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.truncate_long_data,
+            "threshold": self.long_data_threshold or 4000,
+            "head_chars": self.long_data_head_chars or 1200,
+            "tail_chars": self.long_data_tail_chars or 800
+        }
+
+
+def _int_or_default(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_context_config(context: Any) -> ContextConfig:
+    if not isinstance(context, dict):
+        context = {}
+    defaults = ContextConfig()
+    return ContextConfig(
+        compression_enabled=bool(context.get("compression_enabled")),
+        compress_start_pct=_int_or_default(context.get("compress_start_pct"), defaults.compress_start_pct),
+        compress_target_pct=_int_or_default(context.get("compress_target_pct"), defaults.compress_target_pct),
+        min_keep_messages=_int_or_default(context.get("min_keep_messages"), defaults.min_keep_messages),
+        keep_recent_calls=max(0, _int_or_default(context.get("keep_recent_calls"), defaults.keep_recent_calls)),
+        step_calls=max(1, _int_or_default(context.get("step_calls"), defaults.step_calls)),
+        truncate_long_data=bool(context.get("truncate_long_data", True)),
+        long_data_threshold=_int_or_default(context.get("long_data_threshold"), defaults.long_data_threshold),
+        long_data_head_chars=_int_or_default(context.get("long_data_head_chars"), defaults.long_data_head_chars),
+        long_data_tail_chars=_int_or_default(context.get("long_data_tail_chars"), defaults.long_data_tail_chars)
+    )
+
+
+@dataclass(frozen=True)
+class AppConfigView:
+    """Typed, pre-coerced read-only view of the hot-path app config fields."""
+    auto_title_enabled: bool = True
+    reasoning_summary: Optional[str] = None
+    ast_enabled: bool = True
+    code_map_enabled: bool = True
+    react_max_iterations: int = 50
+    task_center_enabled: bool = False
+    task_ui_enabled: bool = False
+    context: ContextConfig = ContextConfig()
+
+
+def parse_app_config_view(config: Any) -> AppConfigView:
+    config = config if isinstance(config, dict) else {}
+    llm = config.get("llm") if isinstance(config.get("llm"), dict) else {}
+    agent = config.get("agent") if isinstance(config.get("agent"), dict) else {}
+    code_map = agent.get("code_map") if isinstance(agent.get("code_map"), dict) else {}
+    reasoning_summary = llm.get("reasoning_summary")
+    return AppConfigView(
+        auto_title_enabled=bool(llm.get("auto_title_enabled", True)),
+        reasoning_summary=str(reasoning_summary) if reasoning_summary else None,
+        ast_enabled=bool(agent.get("ast_enabled", True)),
+        code_map_enabled=bool(code_map.get("enabled", True)),
+        react_max_iterations=_int_or_default(agent.get("react_max_iterations", 50), 50),
+        task_center_enabled=bool(agent.get("task_center_enabled", False)),
+        task_ui_enabled=bool(agent.get("task_ui_enabled", False)),
+        context=parse_context_config(config.get("context"))
+    )
+
+
+_APP_CONFIG_VIEW: Optional[AppConfigView] = None
+_APP_CONFIG_REVISION = 0
+
+
 def get_app_config() -> Dict[str, Any]:
     # Return a defensive copy so callers can't mutate the in-memory singleton.
     return copy.deepcopy(_APP_CONFIG)
 
 
+def get_app_config_revision() -> int:
+    """Counter bumped on every update_app_config; lets callers key caches on the live config."""
+    return _APP_CONFIG_REVISION
+
+
+def get_app_config_view() -> AppConfigView:
+    # Parsed once per config revision; the frozen dataclass is safe to share.
+    global _APP_CONFIG_VIEW
+    if _APP_CONFIG_VIEW is None:
+        _APP_CONFIG_VIEW = parse_app_config_view(_APP_CONFIG)
+    return _APP_CONFIG_VIEW
+
+
+def get_context_config() -> ContextConfig:
+    return get_app_config_view().context
+
+
 def update_app_config(patch: Dict[str, Any]) -> Dict[str, Any]:
     global _APP_CONFIG
     global _CONFIG_PATH_OVERRIDE
+    global _APP_CONFIG_VIEW
+    global _APP_CONFIG_REVISION
     if not isinstance(patch, dict):
         raise ValueError("Config update must be a JSON object.")
     current_file = _load_config_file()
@@ -561,4 +663,6 @@ def update_app_config(patch: Dict[str, Any]) -> Dict[str, Any]:
         else:
             raise
     _APP_CONFIG = _load_config()
+    _APP_CONFIG_VIEW = None
+    _APP_CONFIG_REVISION += 1
     return _APP_CONFIG
@@ -194,11 +194,13 @@ class AstRootIndex:
         return updated
 
     def list_entries(self, include_payload: bool = False) -> List[Dict[str, Any]]:
+        """Entries sorted by path; payloads are shared references, not copies."""
         if not _ast_enabled():
             return []
         entries: List[Dict[str, Any]] = []
         with self.lock:
             items = list(self.files.values())
+        items.sort(key=lambda it: it.path or "")
         for entry in items:
             try:
                 current_mtime = Path(entry.path).stat().st_mtime
@@ -215,7 +217,6 @@ class AstRootIndex:
             if include_payload:
                 item["payload"] = entry.payload
             entries.append(item)
-        entries.sort(key=lambda it: it.get("path") or "")
         return entries
 
 
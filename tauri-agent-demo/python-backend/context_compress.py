@@ -2,9 +2,11 @@ from typing import List, Dict, Any, Optional, Tuple
 import json
 import os
 import re
+from collections import OrderedDict
 
 from models import LLMConfig
 from database import db
+from app_config import get_context_config, parse_context_config
 from mcp_tools import safe_mcp_tool_name
 
 
@@ -17,11 +19,15 @@ CONTEXT_SUMMARY_PROMPT = (
 )
 
 CONTEXT_SUMMARY_MARKER = "[Context Summary]"
-CONTEXT_COMPRESS_KEEP_RECENT_CALLS = 10
-CONTEXT_COMPRESS_STEP_CALLS = 5
 TRUNCATION_MARKER_START = "[TRUNCATED_START]"
 TRUNCATION_MARKER_END = "[TRUNCATED_END]"
 SAFE_TOOL_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+_SUMMARY_ROLE_PREFIX = {"user": "User", "assistant": "Assistant"}
+TOKEN_ESTIMATE_CACHE_MAX_ENTRIES = 4096
+TOKEN_ESTIMATE_CACHE_MIN_CHARS = 256
+
+# (length, hash) of message content -> estimated tokens; keys hold no reference to the text.
+_TOKEN_ESTIMATE_CACHE: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
 
 
 def _debug_log(message: str) -> None:
@@ -32,39 +38,54 @@ def _debug_log(message: str) -> None:
 def _estimate_tokens_for_text(text: str) -> int:
     if not text:
         return 0
-    ascii_count = 0
-    non_ascii = 0
-    for ch in text:
-        if ord(ch) <= 0x7F:
-            ascii_count += 1
-        else:
-            non_ascii += 1
-    return (ascii_count + 3) // 4 + non_ascii
+    if text.isascii():
+        return (len(text) + 3) // 4
+    # Count in C: encoding to ASCII with "ignore" keeps exactly the ASCII characters.
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return (ascii_count + 3) // 4 + (len(text) - ascii_count)
+
+
+def _estimate_tokens_for_content(text: str) -> int:
+    """Memoized _estimate_tokens_for_text for long content re-read on every turn."""
+    if len(text) < TOKEN_ESTIMATE_CACHE_MIN_CHARS:
+        return _estimate_tokens_for_text(text)
+    key = (len(text), hash(text))
+    cached = _TOKEN_ESTIMATE_CACHE.get(key)
+    if cached is not None:
+        _TOKEN_ESTIMATE_CACHE.move_to_end(key)
+        return cached
+    tokens = _estimate_tokens_for_text(text)
+    _TOKEN_ESTIMATE_CACHE[key] = tokens
+    if len(_TOKEN_ESTIMATE_CACHE) > TOKEN_ESTIMATE_CACHE_MAX_ENTRIES:
+        _TOKEN_ESTIMATE_CACHE.popitem(last=False)
+    return tokens
 
 
 def _estimate_tokens_for_messages(messages: List[Dict[str, Any]]) -> int:
     total = 0
     for msg in messages:
-        total += 4
-        total += _estimate_tokens_for_text(str(msg.get("content") or ""))
+        content = msg.get("content")
+        if not content:
+            content = ""
+        elif not isinstance(content, str):
+            content = str(content)
+        total += 4 + _estimate_tokens_for_content(content)
     return total
 
 
-def _format_dialogue_for_summary(messages: List[Dict[str, Any]]) -> str:
-    lines = []
+def _iter_dialogue_lines(messages: List[Dict[str, Any]]):
     for msg in messages:
-        role = msg.get("role")
-        content = str(msg.get("content") or "").strip()
-        if not content:
-            continue
-        if role == "user":
-            prefix = "User"
-        elif role == "assistant":
-            prefix = "Assistant"
-        else:
+        # Check the role first so tool/system content is never stringified or stripped.
+        prefix = _SUMMARY_ROLE_PREFIX.get(msg.get("role"))
+        if prefix is None:
             continue
-        lines.append(f"{prefix}: {content}")
-    return "\n".join(lines)
+        content = str(msg.get("content") or "").strip()
+        if content:
+            yield f"{prefix}: {content}"
+
+
+def _format_dialogue_for_summary(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(_iter_dialogue_lines(messages))
 
 
 def _truncate_text_middle(text: str, cfg: Optional[Dict[str, Any]]) -> str:
@@ -151,15 +172,6 @@ def _normalize_tool_name_for_llm(tool_name: Optional[str]) -> str:
     return sanitized or name
 
 
-def _build_trunc_cfg(context_cfg: Dict[str, Any]) -> Dict[str, Any]:
-    return {
-        "enabled": bool(context_cfg.get("truncate_long_data", True)),
-        "threshold": int(context_cfg.get("long_data_threshold", 4000) or 4000),
-        "head_chars": int(context_cfg.get("long_data_head_chars", 1200) or 1200),
-        "tail_chars": int(context_cfg.get("long_data_tail_chars", 800) or 800)
-    }
-
-
 def _build_context_summary_request(summary: str, dialogue_text: str) -> List[Dict[str, str]]:
     parts = []
     if summary:
@@ -359,11 +371,13 @@ def build_history_for_llm(
 
         history.append({"role": msg.get("role"), "content": msg.get("content")})
 
+    # Keep the prompt prefix byte-stable across turns so provider prompt caches keep hitting:
+    # the summary only changes on compression and stays first, while the code map and task
+    # summary can change every turn and go after the dialogue, just before the new user message.
     if summary:
         history.insert(0, {"role": "assistant", "content": f"{CONTEXT_SUMMARY_MARKER}\n{summary}"})
     if code_map:
-        insert_index = 1 if summary else 0
-        history.insert(insert_index, {"role": "assistant", "content": code_map})
+        history.append({"role": "assistant", "content": code_map})
     try:
         recent_tasks = db.list_agent_tasks(session_id=session_id, limit=5)
     except Exception:
@@ -381,63 +395,46 @@ def build_history_for_llm(
                 line += f": {result}"
             lines.append(line)
         if lines:
-            insert_index = 2 if (summary and code_map) else (1 if (summary or code_map) else 0)
-            history.insert(insert_index, {"role": "assistant", "content": "[Task Summary]\n" + "\n".join(lines)})
+            history.append({"role": "assistant", "content": "[Task Summary]\n" + "\n".join(lines)})
     return history
 
 
 async def maybe_compress_context(
     session_id: str,
     config: LLMConfig,
-    app_config: Dict[str, Any],
     llm_client: Any,
     current_summary: str,
     last_compressed_call_id: Optional[int],
     current_user_message_id: Optional[int],
     current_user_text: str,
-    current_total_tokens: Optional[int] = None
+    current_total_tokens: Optional[int] = None,
+    app_config: Optional[Dict[str, Any]] = None
 ) -> Tuple[str, Optional[int], Optional[int], bool]:
     if not session_id or not current_user_message_id:
         _debug_log("skip: missing session_id or current_user_message_id")
         return current_summary, last_compressed_call_id, None, False
 
-    context_cfg = app_config.get("context", {}) if isinstance(app_config, dict) else {}
-    if not context_cfg.get("compression_enabled"):
+    # Without an explicit config, use the live one, parsed once per config revision.
+    if app_config is None:
+        ctx = get_context_config()
+    else:
+        ctx = parse_context_config(app_config.get("context") if isinstance(app_config, dict) else None)
+    if not ctx.compression_enabled:
         _debug_log("skip: compression disabled")
         return current_summary, last_compressed_call_id, None, False
 
-    try:
-        start_pct = int(context_cfg.get("compress_start_pct", 75))
-    except (TypeError, ValueError):
-        start_pct = 75
-    try:
-        target_pct = int(context_cfg.get("compress_target_pct", 55))
-    except (TypeError, ValueError):
-        target_pct = 55
-    try:
-        min_keep_messages = int(context_cfg.get("min_keep_messages", 1))
-    except (TypeError, ValueError):
-        min_keep_messages = 1
-    try:
-        keep_recent_calls = int(context_cfg.get("keep_recent_calls", CONTEXT_COMPRESS_KEEP_RECENT_CALLS))
-    except (TypeError, ValueError):
-        keep_recent_calls = CONTEXT_COMPRESS_KEEP_RECENT_CALLS
-    try:
-        step_calls = int(context_cfg.get("step_calls", CONTEXT_COMPRESS_STEP_CALLS))
-    except (TypeError, ValueError):
-        step_calls = CONTEXT_COMPRESS_STEP_CALLS
-
-    if keep_recent_calls < 0:
-        keep_recent_calls = 0
-    if step_calls < 1:
-        step_calls = 1
+    start_pct = ctx.compress_start_pct
+    target_pct = ctx.compress_target_pct
+    min_keep_messages = ctx.min_keep_messages
+    keep_recent_calls = ctx.keep_recent_calls
+    step_calls = ctx.step_calls
 
     max_tokens = getattr(config, "max_context_tokens", 0) or 0
     if max_tokens <= 0:
         _debug_log("skip: max_context_tokens <= 0")
         return current_summary, last_compressed_call_id, None, False
 
-    trunc_cfg = _build_trunc_cfg(context_cfg)
+    trunc_cfg = ctx.truncation_cfg()
 
     summary = current_summary or ""
     last_call_id = int(last_compressed_call_id or 0)
@@ -448,8 +445,27 @@ async def maybe_compress_context(
         f"last_message_id={last_message_id}"
     )
 
+    # The loop below only ever moves its window forward, so it reads the calls and
+    # dialogue after the starting point once and slices them in memory.
+    window_start_message_id = last_message_id
+    window_calls: Optional[List[Dict[str, Any]]] = None
+    window_messages: Optional[List[Dict[str, Any]]] = None
+
+    def dialogue_after_start() -> List[Dict[str, Any]]:
+        nonlocal window_messages
+        if window_messages is None:
+            window_messages = db.get_dialogue_messages_after(session_id, window_start_message_id)
+        return window_messages
+
+    def max_message_id_through(call_id: int) -> Optional[int]:
+        # Same as db.get_max_message_id_for_llm_call, answered from the cached calls.
+        candidates = [call["message_id"] for call in window_calls or [] if call["id"] <= call_id and call.get("message_id")]
+        if window_start_message_id:
+            candidates.append(window_start_message_id)
+        return int(max(candidates)) if candidates else None
+
     def build_uncompressed_messages(after_id: Optional[int]) -> List[Dict[str, Any]]:
-        messages = db.get_dialogue_messages_after(session_id, after_id)
+        messages = [msg for msg in dialogue_after_start() if after_id is None or msg["id"] > after_id]
         filtered = []
         for msg in messages:
             msg_for_history = dict(msg)
@@ -465,18 +481,19 @@ async def maybe_compress_context(
             filtered.append(msg_for_history)
         return filtered
 
-    history_for_llm = build_history_for_llm(
-        session_id,
-        last_message_id,
-        current_user_message_id,
-        summary,
-        None,
-        trunc_cfg
-    )
     if current_total_tokens is not None:
+        # The caller already measured the prompt; no need to rebuild the history to decide.
         initial_tokens = int(current_total_tokens)
         _debug_log(f"using current_total_tokens={initial_tokens}")
     else:
+        history_for_llm = build_history_for_llm(
+            session_id,
+            last_message_id,
+            current_user_message_id,
+            summary,
+            None,
+            trunc_cfg
+        )
         initial_tokens = _estimate_tokens_for_messages(history_for_llm)
         if current_user_text:
             initial_tokens += _estimate_tokens_for_text(current_user_text)
@@ -488,7 +505,9 @@ async def maybe_compress_context(
     did_compress = False
 
     while True:
-        calls_after = db.get_llm_call_metas_after(session_id, last_call_id)
+        if window_calls is None:
+            window_calls = db.get_llm_call_metas_after(session_id, last_call_id)
+        calls_after = [call for call in window_calls if call["id"] > last_call_id]
         if len(calls_after) <= keep_window:
             _debug_log(f"stop: calls_after={len(calls_after)} <= keep_window={keep_window}")
             break
@@ -519,16 +538,15 @@ async def maybe_compress_context(
             continue
 
         boundary_call_id = int(boundary_call["id"])
-        boundary_message_id = db.get_max_message_id_for_llm_call(session_id, boundary_call_id)
+        boundary_message_id = max_message_id_through(boundary_call_id)
         if not boundary_message_id:
             _debug_log(f"stop: no boundary_message_id for call {boundary_call_id}")
             break
 
-        messages_between = db.get_dialogue_messages_between(
-            session_id,
-            (last_message_id or 0) + 1,
-            boundary_message_id
-        )
+        lower_message_id = last_message_id or 0
+        messages_between = [
+            msg for msg in dialogue_after_start() if lower_message_id < msg["id"] <= boundary_message_id
+        ]
         if not messages_between:
             _debug_log("stop: no messages_between to compress")
             break
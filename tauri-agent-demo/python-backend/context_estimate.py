@@ -5,14 +5,12 @@ import json
 def estimate_tokens_for_text(text: str) -> int:
     if not text:
         return 0
-    ascii_count = 0
-    non_ascii = 0
-    for ch in str(text):
-        if ord(ch) <= 0x7F:
-            ascii_count += 1
-        else:
-            non_ascii += 1
-    return (ascii_count + 3) // 4 + non_ascii
+    text = str(text)
+    if text.isascii():
+        return (len(text) + 3) // 4
+    # Count in C: encoding to ASCII with "ignore" keeps exactly the ASCII characters.
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return (ascii_count + 3) // 4 + (len(text) - ascii_count)
 
 
 def estimate_tokens_for_messages(messages: List[Dict[str, Any]]) -> int:
@@ -1,9 +1,10 @@
-from typing import List, Optional, Dict, Any, Set, Iterator
+from typing import List, Optional, Dict, Any, Set, Iterator, Tuple
 import json
 import os
 from contextlib import contextmanager
 from datetime import datetime
 import sqlite3
+import threading
 import uuid
 from models import (
     LLMConfig,
@@ -24,6 +25,9 @@ from models import (
 
 DATABASE_PATH = os.getenv("TAURI_AGENT_DB_PATH", "chat_app.db")
 SCHEMA_VERSION = 20260306
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_POOL_SIZE = 8
+SQLITE_MAX_IN_PARAMS = 900
 CORE_TABLES = (
     'session_tool_call_history',
     'file_snapshots',
@@ -46,30 +50,89 @@ AGENT_TABLES = (
 )
 
 
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to the owning Database's idle pool."""
+
+    _pool_owner: Optional["Database"] = None
+    _pool_idle = False
+
+    def close(self) -> None:
+        if self._pool_idle:
+            return
+        owner = self._pool_owner
+        if owner is not None and owner._release_connection(self):
+            return
+        self._pool_owner = None
+        super().close()
+
+
 class Database:
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        self._wal_enabled = False
+        self._pool: List[_PooledConnection] = []
+        self._pool_lock = threading.Lock()
         parent = os.path.dirname(self.db_path)
         if parent:
             os.makedirs(parent, exist_ok=True)
         self.init_database()
 
     def get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        """Get database connection (reused from the idle pool when possible)."""
+        with self._pool_lock:
+            if self._pool:
+                conn = self._pool.pop()
+                conn._pool_idle = False
+                return conn
+        return self._open_connection()
+
+    def _open_connection(self) -> sqlite3.Connection:
+        # Pooled connections hop between worker threads, but only one holds a connection at a time.
+        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False, factory=_PooledConnection)
+        conn._pool_owner = self
         conn.row_factory = sqlite3.Row
         conn.execute('PRAGMA foreign_keys = ON')
         conn.execute('PRAGMA busy_timeout = 30000')
-        try:
-            conn.execute('PRAGMA journal_mode = WAL')
-        except sqlite3.DatabaseError:
-            pass
+        # journal_mode=WAL is persistent in the file, so it only has to be switched once per process.
+        if not self._wal_enabled:
+            try:
+                mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()
+                self._wal_enabled = bool(mode) and str(mode[0]).lower() == 'wal'
+            except sqlite3.DatabaseError:
+                pass
         try:
             conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
         except sqlite3.DatabaseError:
             pass
         return conn
 
+    def _release_connection(self, conn: _PooledConnection) -> bool:
+        """Park conn in the idle pool; False means the caller should really close it."""
+        try:
+            # Callers that close without committing expect their changes to be discarded.
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            return False
+        with self._pool_lock:
+            if len(self._pool) >= SQLITE_POOL_SIZE:
+                return False
+            conn._pool_idle = True
+            self._pool.append(conn)
+        return True
+
+    def close_connections(self) -> None:
+        """Close every idle pooled connection."""
+        with self._pool_lock:
+            idle, self._pool = self._pool, []
+        for conn in idle:
+            conn._pool_idle = False
+            conn._pool_owner = None
+            conn.close()
+
     @contextmanager
     def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
         conn = self.get_connection()
@@ -738,6 +801,23 @@ class Database:
             return ChatSession(**data)
         return None
     
+    def get_session_bundle(
+        self,
+        session_id: str,
+        history_limit: Optional[int] = None
+    ) -> Tuple[Optional[ChatSession], Optional[LLMConfig], List[ChatMessage]]:
+        """Get session, its config and (when history_limit is set) its latest messages in one call.
+
+        Chat handlers run this in one worker thread, so the lookups cost a single thread hop
+        instead of one each; every lookup still checks its own connection out of the pool.
+        """
+        session = self.get_session(session_id)
+        if not session:
+            return None, None, []
+        config = self.get_config(session.config_id)
+        history = self.get_session_messages(session_id, history_limit) if history_limit else []
+        return session, config, history
+
     def get_all_sessions(self) -> List[ChatSession]:
         """Get all sessions"""
         conn = self.get_connection()
@@ -1127,6 +1207,18 @@ class Database:
             raw_response=message.raw_response
         )
     
+    def update_message_content(self, message_id: int, content: str) -> None:
+        """Update message content"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE chat_messages
+            SET content = ?
+            WHERE id = ?
+        ''', (content, message_id))
+        conn.commit()
+        conn.close()
+
     def get_session_messages(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
         """Get session messages"""
         conn = self.get_connection()
@@ -1192,6 +1284,35 @@ class Database:
 
         return messages
 
+    def get_messages_for_export(self, session_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Role/content/timestamp of every message in the given sessions, grouped by session id."""
+        grouped: Dict[str, List[Dict[str, Any]]] = {session_id: [] for session_id in session_ids}
+        if not session_ids:
+            return grouped
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Stay below SQLite's default limit of 999 bound parameters.
+        for start in range(0, len(session_ids), SQLITE_MAX_IN_PARAMS):
+            chunk = session_ids[start:start + SQLITE_MAX_IN_PARAMS]
+            placeholders = ",".join(["?"] * len(chunk))
+            cursor.execute(
+                f'''
+                SELECT session_id, role, content, timestamp
+                FROM chat_messages
+                WHERE session_id IN ({placeholders})
+                ORDER BY session_id, timestamp ASC, id ASC
+                ''',
+                chunk
+            )
+            for row in cursor.fetchall():
+                grouped[row['session_id']].append({
+                    "role": row['role'],
+                    "content": row['content'],
+                    "timestamp": row['timestamp']
+                })
+        conn.close()
+        return grouped
+
     def get_session_messages_before(self, session_id: str, before_id: int, limit: int) -> List[ChatMessage]:
         """Get session messages before a message id (latest first, then reversed)."""
         conn = self.get_connection()
@@ -1433,6 +1554,14 @@ class Database:
         row = cursor.fetchone()
         conn.close()
         return dict(row) if row else None
+
+    def attachment_exists(self, attachment_id: int) -> bool:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM message_attachments WHERE id = ?', (attachment_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row is not None
     
     # ==================== Agent Steps + Tool Calls ====================
     
@@ -1454,6 +1583,23 @@ class Database:
         conn.close()
         
         return step_id
+
+    def save_agent_steps_bulk(self, message_id: int, steps: List[Tuple[str, str, int, Optional[Dict[str, Any]], str]]) -> None:
+        """Save (step_type, content, sequence, metadata, timestamp) rows for one message in a single transaction"""
+        if not steps:
+            return
+        rows = [
+            (message_id, step_type, content, json.dumps(metadata) if metadata else None, sequence, timestamp)
+            for step_type, content, sequence, metadata, timestamp in steps
+        ]
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO agent_steps (message_id, step_type, content, metadata, sequence, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        conn.close()
     
     def get_agent_steps(self, message_id: int) -> List[Dict[str, Any]]:
         """Get agent steps for message"""
@@ -0,0 +1,151 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llm_client import LLMRequestStopped
+from models import LLMConfig
+
+
+LLM_CACHE_MAX_ENTRIES = 512
+LLM_CACHE_TTL_SECONDS = 3600.0
+
+
+class LLMResponseCache:
+    """Exact-match, in-process LRU cache for non-streaming LLM responses."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL_SECONDS) -> None:
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def make_key(
+        self,
+        config: LLMConfig,
+        messages: List[Dict[str, Any]],
+        scope: str,
+        force: bool = False
+    ) -> Optional[str]:
+        """Return a cache key, or None when the request is not deterministic enough to cache."""
+        temperature = config.temperature or 0
+        if temperature > 0 and not force:
+            return None
+        payload = {
+            "scope": scope,
+            "api_profile": config.api_profile,
+            "api_format": config.api_format,
+            "base_url": config.base_url,
+            "model": config.model,
+            "temperature": temperature,
+            "max_tokens": config.max_tokens,
+            "messages": messages,
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not key:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: Optional[str], value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        if not key or not isinstance(value, dict):
+            return
+        stored = self._shared_copy(value)
+        expires_at = time.monotonic() + (self._ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, stored)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _shared_copy(value: Dict[str, Any]) -> Dict[str, Any]:
+        # Only the response itself is shared; per-call fields such as llm_call_id belong to the
+        # caller whose fetch produced them.
+        return copy.deepcopy({
+            "content": value.get("content", ""),
+            "raw_response": value.get("raw_response"),
+        })
+
+    async def get_or_fetch(
+        self,
+        key: Optional[str],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Return a cached response, joining an identical in-flight request instead of issuing a new one.
+
+        Only the caller whose fetch runs gets the full result; cache hits and joined callers get
+        just content and raw_response, and must log their own call if they need one.
+        """
+        if not key:
+            return await fetch()
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                return self._shared_copy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+            except LLMRequestStopped:
+                pass
+            # The leader was cancelled or stopped by its own caller; that says nothing about this
+            # request, so run (or join) a fresh fetch instead of inheriting the failure.
+        future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark retrieved so an unjoined failure does not log "exception was never retrieved".
+            future.exception()
+            raise
+        else:
+            self.set(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "ttl_seconds": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+llm_response_cache = LLMResponseCache()
@@ -1,10 +1,41 @@
 from typing import Optional, List, Dict, Any, Tuple
 import asyncio
+from contextlib import asynccontextmanager
 import httpx
 from models import LLMConfig
 from app_config import get_app_config
 
 
+LLM_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=200, keepalive_expiry=60.0)
+
+_shared_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+
+def _get_shared_http_client() -> httpx.AsyncClient:
+    """Return the pooled AsyncClient for the running loop so TCP/TLS connections are reused."""
+    loop = asyncio.get_running_loop()
+    entry = _shared_clients.get(id(loop))
+    if entry is not None and entry[0] is loop and not entry[1].is_closed:
+        return entry[1]
+    client = httpx.AsyncClient(limits=LLM_HTTP_LIMITS)
+    _shared_clients[id(loop)] = (loop, client)
+    return client
+
+
+@asynccontextmanager
+async def _shared_http_client():
+    yield _get_shared_http_client()
+
+
+async def close_shared_http_clients() -> None:
+    loop = asyncio.get_running_loop()
+    for key, (client_loop, client) in list(_shared_clients.items()):
+        if client_loop is loop or client_loop.is_closed():
+            _shared_clients.pop(key, None)
+            if client_loop is loop:
+                await client.aclose()
+
+
 class LLMTransientError(Exception):
     def __init__(self, message: str, status_code: Optional[int] = None, cause: Optional[BaseException] = None):
         super().__init__(message)
@@ -12,26 +43,30 @@ class LLMTransientError(Exception):
         self.cause = cause
 
 
+class LLMRequestStopped(RuntimeError):
+    """Raised when a request is abandoned because its caller's stop event fired."""
+
+
 class LLMClient:
     """Unified LLM client supporting multiple formats and profiles."""
 
     def __init__(self, config: LLMConfig):
         self.config = config
-        self.timeout = self._resolve_timeout()
-        self.max_retries, self.retry_base_delay, self.retry_max_delay = self._resolve_retry_policy()
+        # One config snapshot (a deep copy) serves both lookups.
+        llm_cfg = get_app_config().get("llm", {})
+        self.timeout = self._resolve_timeout(llm_cfg)
+        self.max_retries, self.retry_base_delay, self.retry_max_delay = self._resolve_retry_policy(llm_cfg)
 
-    def _resolve_timeout(self) -> float:
-        app_config = get_app_config()
-        timeout = app_config.get("llm", {}).get("timeout_sec", 180.0)
+    def _resolve_timeout(self, llm_cfg: Dict[str, Any]) -> float:
+        timeout = llm_cfg.get("timeout_sec", 180.0)
         try:
             timeout = float(timeout)
         except (TypeError, ValueError):
             return 180.0
         return max(1.0, timeout)
 
-    def _resolve_retry_policy(self) -> Tuple[int, float, float]:
-        app_config = get_app_config()
-        retry_cfg = app_config.get("llm", {}).get("retry", {})
+    def _resolve_retry_policy(self, llm_cfg: Dict[str, Any]) -> Tuple[int, float, float]:
+        retry_cfg = llm_cfg.get("retry", {})
         max_retries = retry_cfg.get("max_retries", 5)
         base_delay = retry_cfg.get("base_delay_sec", 1.0)
         max_delay = retry_cfg.get("max_delay_sec", 8.0)
@@ -328,6 +363,31 @@ class LLMClient:
         debug_ctx["llm_call_id"] = llm_call_id
         return llm_call_id
 
+    def record_shared_response(
+        self,
+        messages: List[Dict[str, Any]],
+        request_overrides: Optional[Dict[str, Any]],
+        result: Dict[str, Any]
+    ) -> Optional[int]:
+        """Log a response served from the shared cache as this caller's own llm_calls row."""
+        debug_ctx = self._get_debug_context(request_overrides)
+        if not debug_ctx:
+            return None
+        request_payload = {
+            "model": self.config.model,
+            "messages": messages,
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens
+        }
+        response_json = result.get("raw_response")
+        return self._save_llm_call(
+            debug_ctx,
+            stream=False,
+            request_payload=request_payload,
+            response_json=response_json if isinstance(response_json, dict) else {},
+            response_text=result.get("content") or ""
+        )
+
     def _apply_reasoning_params(self, request_payload: Dict[str, Any]) -> None:
         profile = self._get_profile()
         model_lower = self.config.model.lower()
@@ -390,7 +450,7 @@ class LLMClient:
 
         self._apply_reasoning_params(request_payload)
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 try:
                     response = await client.post(
@@ -399,7 +459,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     )
                 except httpx.RequestError as exc:
                     if attempt < self.max_retries:
@@ -484,7 +545,7 @@ class LLMClient:
         self._apply_reasoning_params(request_payload)
 
         completed = False
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 should_retry = False
                 retry_status = None
@@ -496,7 +557,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     ) as response:
                         if self._should_retry_status(response.status_code) and attempt < self.max_retries:
                             retry_status = response.status_code
@@ -598,7 +660,7 @@ class LLMClient:
         self._apply_reasoning_params(request_payload)
 
         completed = False
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 should_retry = False
                 retry_status = None
@@ -610,7 +672,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     ) as response:
                         if self._should_retry_status(response.status_code) and attempt < self.max_retries:
                             retry_status = response.status_code
@@ -760,7 +823,7 @@ class LLMClient:
 
         self._apply_reasoning_params(request_payload)
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 try:
                     response = await client.post(
@@ -769,7 +832,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     )
                 except httpx.RequestError as exc:
                     if attempt < self.max_retries:
@@ -853,7 +917,7 @@ class LLMClient:
         self._apply_reasoning_params(request_payload)
 
         completed = False
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 should_retry = False
                 retry_status = None
@@ -865,7 +929,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     ) as response:
                         if self._should_retry_status(response.status_code) and attempt < self.max_retries:
                             retry_status = response.status_code
@@ -975,7 +1040,7 @@ class LLMClient:
         self._apply_reasoning_params(request_payload)
 
         completed = False
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with _shared_http_client() as client:
             for attempt in range(self.max_retries + 1):
                 should_retry = False
                 retry_status = None
@@ -987,7 +1052,8 @@ class LLMClient:
                             "Authorization": f"Bearer {self.config.api_key}",
                             "Content-Type": "application/json"
                         },
-                        json=request_payload
+                        json=request_payload,
+                        timeout=self.timeout
                     ) as response:
                         if self._should_retry_status(response.status_code) and attempt < self.max_retries:
                             retry_status = response.status_code
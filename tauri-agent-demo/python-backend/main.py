@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, Response, Query, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, Response, Query, WebSocket, WebSocketDisconnect, BackgroundTasks
 from fastapi.responses import StreamingResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import asyncio
@@ -8,21 +8,30 @@ from contextlib import asynccontextmanager
 import uvicorn
 import json
 import os
+import stat
 import argparse
-import shlex
 import base64
+import binascii
+import zlib
 import re
 import time
 import atexit
 import signal
 from io import BytesIO
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 import traceback
+from dataclasses import dataclass
 
 from PIL import Image
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 from models import (
     LLMConfig, LLMConfigCreate, LLMConfigUpdate,
     ChatMessage, ChatMessageCreate,
@@ -34,7 +43,7 @@ from models import (
     TaskStatus, TaskErrorCode
 )
 from database import db
-from llm_client import create_llm_client
+from llm_client import create_llm_client, close_shared_http_clients, LLMTransientError, LLMRequestStopped
 from message_processor import message_processor
 
 from agents.executor import create_agent_executor
@@ -42,15 +51,17 @@ from agents.prompt_builder import build_agent_prompt_and_tools
 from agents.base import AgentStep
 from tools.builtin import register_builtin_tools
 from tools.base import ToolRegistry
-from tools.config import get_tool_config, update_tool_config, get_tool_config_path
-from stream_registry import get_stream_registry
+from tools.config import get_tool_config, update_tool_config, get_tool_config_path, get_shell_allowset
+from stream_registry import get_stream_registry, encode_sse_data, encode_sse_content, SSE_HEADERS
 from pty_stream_registry import get_pty_stream_registry
 from ws_hub import get_ws_hub
 from tools.context import set_tool_context, reset_tool_context
-from tools.builtin.system_tools import ApplyPatchTool, CodeAstTool
+from tools.builtin.system_tools import ApplyPatchTool, CodeAstTool, _COMMAND_FIRST_TOKEN_RE
 from tools.pty_manager import get_pty_manager
 from stream_control import stream_stop_registry
-from app_config import get_app_config, update_app_config, get_app_config_path
+from llm_cache import llm_response_cache
+from title_cache import title_similarity_cache
+from app_config import get_app_config, update_app_config, get_app_config_path, get_app_config_view, get_context_config
 from mcp_tools import register_mcp_tools_from_config, refresh_mcp_tools
 from ghost_snapshot import restore_snapshot
 from code_map import build_code_map_prompt
@@ -144,9 +155,26 @@ async def lifespan(_: FastAPI):
             await TASK_ORCHESTRATOR.stop()
         except Exception:
             pass
+        try:
+            await close_shared_http_clients()
+        except Exception:
+            pass
+        names, batch = _take_pending_shell_allowlist()
+        if names:
+            await _flush_shell_allowlist(names, batch)
+        try:
+            db.close_connections()
+        except Exception:
+            pass
 
 
-app = FastAPI(title="Tauri Agent Chat Backend", lifespan=lifespan)
+DEFAULT_JSON_RESPONSE = ORJSONResponse if orjson is not None else JSONResponse
+
+app = FastAPI(
+    title="Tauri Agent Chat Backend",
+    lifespan=lifespan,
+    default_response_class=DEFAULT_JSON_RESPONSE
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -203,40 +231,87 @@ def _schedule_ast_scan(work_path: Optional[str]) -> None:
 
 # ==================== Local File Read ====================
 
+def _read_local_file_bytes(path: str, max_bytes: Optional[int]) -> bytes:
+    # Unbuffered: one read() on the raw FileIO instead of copying through a BufferedReader,
+    # as CPython's Path.read_bytes does.
+    with open(path, "rb", buffering=0) as file:
+        if not max_bytes:
+            return file.readall()
+        # One extra byte tells a file that grew past the limit after the stat apart from one that fits.
+        chunks = []
+        remaining = max_bytes + 1
+        while remaining > 0:
+            chunk = file.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+
+@lru_cache(maxsize=1024)
+def _normalize_local_path(path: str) -> str:
+    # The backend never changes its cwd, so the result only depends on the input string.
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def _regular_file_size(path: str) -> Optional[int]:
+    """Size of a regular file from a single stat() call, or None if it is missing or not a file."""
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+
 @app.get("/local-file")
-def read_local_file(path: str = Query(...), max_bytes: int = Query(2_000_000)):
+async def read_local_file(path: str = Query(...), max_bytes: int = Query(2_000_000)):
     if not path:
         raise HTTPException(status_code=400, detail="Missing path")
-    safe_path = os.path.abspath(os.path.expanduser(path))
-    if not os.path.isfile(safe_path):
+    safe_path = _normalize_local_path(path)
+    size = await asyncio.to_thread(_regular_file_size, safe_path)
+    if size is None:
         raise HTTPException(status_code=404, detail="File not found")
+    if max_bytes and size > max_bytes:
+        raise HTTPException(status_code=413, detail="File too large")
     try:
-        size = os.path.getsize(safe_path)
-        if max_bytes and size > max_bytes:
-            raise HTTPException(status_code=413, detail="File too large")
-        with open(safe_path, "rb") as file:
-            raw = file.read(max_bytes + 1 if max_bytes else None)
-        if max_bytes and len(raw) > max_bytes:
-            raise HTTPException(status_code=413, detail="File too large")
-        content = raw.decode("utf-8", errors="replace")
-        return {"content": content}
-    except HTTPException:
-        raise
+        raw = await asyncio.to_thread(_read_local_file_bytes, safe_path, max_bytes or None)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Failed to read file: {exc}")
+    if max_bytes and len(raw) > max_bytes:
+        raise HTTPException(status_code=413, detail="File too large")
+    return {"content": raw.decode("utf-8", errors="replace")}
 
 @app.get("/local-file-exists")
-def local_file_exists(path: str = Query(...)):
+async def local_file_exists(path: str = Query(...)):
     if not path:
         raise HTTPException(status_code=400, detail="Missing path")
-    safe_path = os.path.abspath(os.path.expanduser(path))
-    return {"exists": os.path.isfile(safe_path)}
+    safe_path = _normalize_local_path(path)
+    return {"exists": await asyncio.to_thread(os.path.isfile, safe_path)}
 
 # ==================== Title Generation ====================
 
+# build_messages_for_llm keeps only this many history messages, so load no more than that.
+CHAT_HISTORY_LIMIT = 10
 TITLE_MAX_CHARS = 40
 TITLE_FALLBACK_CHARS = 20
 TITLE_REQUEST_TIMEOUT = 15.0
+TITLE_MAX_CONCURRENT_REQUESTS = 4
+ATTACHMENT_MAX_CONCURRENCY = min(8, os.cpu_count() or 1)
+ANSWER_REPLAY_CHUNK_CHARS = 64
+ANSWER_REPLAY_SINGLE_FRAME_CHARS = 512
+ANSWER_REPLAY_MAX_FRAMES = 64
+# Non-delta agent steps are committed in batches; answer/error steps and the end of a run flush at once.
+AGENT_STEP_FLUSH_COUNT = 8
+AGENT_STEP_FLUSH_INTERVAL_SEC = 0.25
+CHAT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+TITLE_SYSTEM_PROMPT = (
+    "You generate concise chat titles. "
+    "Output only the title. "
+    "Use the user's language. "
+    "3-12 words or <=20 Chinese characters. "
+    "No quotes, no emojis, no trailing punctuation."
+)
 PTY_PROMPT_CMD_MAX_CHARS = 160
 PTY_PROMPT_PER_PTY_MAX_LINES = 120
 PTY_PROMPT_PER_PTY_MAX_BYTES = 4 * 1024
@@ -245,6 +320,114 @@ PTY_PROMPT_MAX_VISIBLE_PTYS = 64
 _PTY_PROMPT_ANSI_RE = re.compile(r"[\u001b\u009b][\\[\]()#;?]*(?:[0-9]{1,4}(?:;[0-9]{0,4})*)?[@-~]")
 _PTY_PROMPT_OSC_RE = re.compile(r"\x1b\][^\x07]*(?:\x07|\x1b\\)")
 _PTY_PROMPT_CTRL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_TITLE_REQUEST_SEMAPHORE = asyncio.Semaphore(TITLE_MAX_CONCURRENT_REQUESTS)
+# PIL releases the GIL while decoding/encoding, so attachments convert in parallel worker threads.
+_ATTACHMENT_SEMAPHORE = asyncio.Semaphore(ATTACHMENT_MAX_CONCURRENCY)
+# SQLite allows a single writer; queue stream writes here instead of in its busy handler.
+_DB_WRITE_LOCK = asyncio.Lock()
+# Strong references to fire-and-forget tasks; the loop only keeps weak ones.
+_BACKGROUND_TASKS: Set[asyncio.Task] = set()
+# Leading "标题/题目/主题/Title" label emitted by some models.
+_TITLE_PREFIX_RE = re.compile(r"^(?:\u6807\u9898|\u9898\u76ee|\u4e3b\u9898|title)[\uff1a:]", re.IGNORECASE)
+# Markers of reasoning text rather than a title: 分析/步骤/最终/结论/标题/选项.
+_TITLE_BAD_MARKERS_RE = re.compile(
+    r"\u5206\u6790|\u6b65\u9aa4|\u6700\u7ec8|\u7ed3\u8bba|Reasoning|analysis|step|Title:|\u6807\u9898|\u9009\u9879"
+)
+_WINDOWS_EXEC_SUFFIXES = (".exe", ".cmd", ".bat")
+_TEXT_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+_TITLE_TRAILING_PUNCT = " .,!?:;" + "\uFF0C\u3002\uFF01\uFF1F\uFF1B\uFF1A"
+# Everything up to the first line boundary, using the same separators as str.splitlines().
+_FIRST_LINE_RE = re.compile(r"[^\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]*")
+
+
+def _stream_text_chunks(text: str, min_chars: int = ANSWER_REPLAY_CHUNK_CHARS):
+    """Split text on word boundaries into frames of at least min_chars (the last may be shorter).
+
+    Short text is sent as one frame, and long text is capped at about ANSWER_REPLAY_MAX_FRAMES frames.
+    """
+    if not text:
+        return
+    if len(text) <= ANSWER_REPLAY_SINGLE_FRAME_CHARS:
+        yield text
+        return
+    min_chars = max(min_chars, len(text) // ANSWER_REPLAY_MAX_FRAMES)
+    buffer: List[str] = []
+    size = 0
+    for match in _TEXT_CHUNK_RE.finditer(text):
+        piece = match.group(0)
+        buffer.append(piece)
+        size += len(piece)
+        if size >= min_chars:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def _db_write(func, *args, **kwargs):
+    """Run a blocking SQLite write on a worker thread, one writer at a time."""
+    async with _DB_WRITE_LOCK:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+class _AgentStepWriter:
+    """Buffer agent-step rows for one message and write them in one transaction per batch.
+
+    A batch is written once it holds AGENT_STEP_FLUSH_COUNT rows or its first row has waited
+    AGENT_STEP_FLUSH_INTERVAL_SEC, whichever comes first; the timer covers long tool runs and
+    LLM calls during which no further step arrives.
+    """
+
+    def __init__(self, message_id: int) -> None:
+        self._message_id = message_id
+        self._pending: List[Tuple[str, str, int, Optional[Dict[str, Any]], str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Serializes flushes so a final flush also waits for a timer flush that is still writing.
+        self._write_lock = asyncio.Lock()
+
+    def add(self, step_type: str, content: str, sequence: int, metadata: Optional[Dict[str, Any]]) -> bool:
+        """Queue a row; returns True once the batch is full and should be flushed now."""
+        # Stamped now, not at flush time, so each row records when its step happened.
+        self._pending.append((step_type, content, sequence, metadata, datetime.now().isoformat()))
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                AGENT_STEP_FLUSH_INTERVAL_SEC,
+                self._flush_in_background
+            )
+        return len(self._pending) >= AGENT_STEP_FLUSH_COUNT
+
+    def _flush_in_background(self) -> None:
+        self._timer = None
+        _spawn_background(self.flush_logged())
+
+    async def flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception as exc:
+            print(f"[Agent Steps] Failed to save steps: {exc}")
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._write_lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            await _db_write(db.save_agent_steps_bulk, self._message_id, rows)
+
+
+def _spawn_background(coro) -> asyncio.Task:
+    """Run coro without awaiting it, keeping the task alive until it finishes."""
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+def _system_role_for(config: LLMConfig) -> str:
+    return "developer" if config.api_profile == "openai" else "system"
 
 
 def _truncate_text(text: str, max_chars: int) -> str:
@@ -255,7 +438,9 @@ def _truncate_text(text: str, max_chars: int) -> str:
 
 
 def _fallback_title(user_message: str) -> str:
-    base = (user_message or "").strip().splitlines()[0] if user_message else ""
+    # Only the first TITLE_FALLBACK_CHARS + 1 characters can affect the result.
+    head = (user_message or "").strip()[:TITLE_FALLBACK_CHARS + 1]
+    base = head.splitlines()[0] if head else ""
     if not base:
         return "New Chat"
     if len(base) > TITLE_FALLBACK_CHARS:
@@ -263,23 +448,18 @@ def _fallback_title(user_message: str) -> str:
     return base
 
 
+def _format_agent_error_traceback(exc: BaseException) -> str:
+    # Expected failures (HTTP errors, retried-out LLM transients) don't need the frame walk or the
+    # chained httpx traceback; unexpected ones keep the full trace the step view shows.
+    if isinstance(exc, (HTTPException, LLMTransientError)):
+        return "".join(traceback.format_exception_only(type(exc), exc))
+    return traceback.format_exc()
+
+
 def _update_message_content(message_id: Optional[int], content: str) -> None:
     if not message_id:
         return
-    conn = db.get_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            '''
-            UPDATE chat_messages
-            SET content = ?
-            WHERE id = ?
-            ''',
-            (content, message_id)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    db.update_message_content(message_id, content)
 
 
 def _persist_agent_failure_message(
@@ -444,21 +624,11 @@ def _append_reasoning_summary_prompt(system_prompt: str, reasoning_summary: Opti
 
 def _clean_title(raw_title: str) -> str:
     title = (raw_title or "").strip().strip('"').strip("'")
-    title = title.splitlines()[0].strip() if title else ""
-    for prefix in (
-        "\u6807\u9898\uff1a",
-        "\u6807\u9898:",
-        "Title:",
-        "title:",
-        "\u9898\u76ee\uff1a",
-        "\u9898\u76ee:",
-        "\u4e3b\u9898\uff1a",
-        "\u4e3b\u9898:"
-    ):
-        if title.lower().startswith(prefix.lower()):
-            title = title[len(prefix):].strip()
-            break
-    title = title.rstrip(" .,!?:;" + "\uFF0C\u3002\uFF01\uFF1F\uFF1B\uFF1A")
+    title = _FIRST_LINE_RE.match(title).group().strip()
+    prefix_match = _TITLE_PREFIX_RE.match(title)
+    if prefix_match:
+        title = title[prefix_match.end():].strip()
+    title = title.rstrip(_TITLE_TRAILING_PUNCT)
     if len(title) > TITLE_MAX_CHARS:
         title = title[:TITLE_MAX_CHARS].rstrip() + "..."
     return title
@@ -499,50 +669,41 @@ def _extract_json_slice(text: str) -> str:
 def _parse_title_json(raw: str) -> str:
     if not raw:
         return ""
-    import json as _json
-    candidate = _strip_json_fence(raw)
-    for chunk in (candidate, _extract_json_slice(candidate)):
-        if not chunk:
-            continue
-        try:
-            data = _json.loads(chunk)
-            if isinstance(data, dict):
-                title = data.get("title")
-                if isinstance(title, str) and title.strip():
-                    return title.strip()
-        except Exception:
-            continue
+    # Any candidate that parses to an object is already its own {...} slice, so one parse suffices.
+    chunk = _extract_json_slice(_strip_json_fence(raw))
+    if not chunk:
+        return ""
+    try:
+        data = orjson.loads(chunk) if orjson is not None else json.loads(chunk)
+    except Exception:
+        return ""
+    if isinstance(data, dict):
+        title = data.get("title")
+        if isinstance(title, str) and title.strip():
+            return title.strip()
     return ""
 
 
+@lru_cache(maxsize=512)
 def _extract_command_name(command: str) -> str:
     if not command:
         return ""
-    try:
-        parts = shlex.split(command, posix=False)
-    except Exception:
-        parts = command.strip().split()
-    if not parts:
+    match = _COMMAND_FIRST_TOKEN_RE.match(command)
+    if not match:
         return ""
-    first = parts[0].strip().strip('"').strip("'")
+    first = match.group(1).strip().strip('"').strip("'")
     base = os.path.basename(first).lower()
-    if base.endswith(".exe") or base.endswith(".cmd") or base.endswith(".bat"):
-        base = os.path.splitext(base)[0]
+    if base.endswith(_WINDOWS_EXEC_SUFFIXES):
+        base = base[:-4]
     return base
 
 
-def _agent_config() -> Dict[str, Any]:
-    config = get_app_config()
-    agent_cfg = config.get("agent") if isinstance(config, dict) else {}
-    return agent_cfg if isinstance(agent_cfg, dict) else {}
-
-
 def _task_center_enabled() -> bool:
-    return bool(_agent_config().get("task_center_enabled", False))
+    return get_app_config_view().task_center_enabled
 
 
 def _task_ui_enabled() -> bool:
-    return bool(_agent_config().get("task_ui_enabled", False))
+    return get_app_config_view().task_ui_enabled
 
 
 def _task_error_response(
@@ -571,21 +732,8 @@ def _looks_like_title(raw: str) -> bool:
         return False
     if len(text) > (TITLE_MAX_CHARS + 5):
         return False
-    bad_markers = [
-        "\u5206\u6790",  # 分析
-        "\u6b65\u9aa4",  # 步骤
-        "\u6700\u7ec8",  # 最终
-        "\u7ed3\u8bba",  # 结论
-        "Reasoning",
-        "analysis",
-        "step",
-        "Title:",
-        "\u6807\u9898",
-        "\u9009\u9879"   # 选项
-    ]
-    for marker in bad_markers:
-        if marker in text:
-            return False
+    if _TITLE_BAD_MARKERS_RE.search(text):
+        return False
     return True
 
 
@@ -615,12 +763,15 @@ def _prepare_attachment_input(item: Any) -> Optional[Dict[str, Any]]:
 
     width = getattr(item, "width", None)
     height = getattr(item, "height", None)
-    if (width is None or height is None) and mime.startswith("image/"):
-        try:
-            with Image.open(BytesIO(decoded)) as img:
+    llm_image = None
+    # Open once for both the dimension probe and the LLM conversion.
+    try:
+        with Image.open(BytesIO(decoded)) as img:
+            if (width is None or height is None) and mime.startswith("image/"):
                 width, height = img.size
-        except Exception:
-            pass
+            llm_image = _convert_image_for_llm(img, decoded)
+    except Exception:
+        pass
 
     size = getattr(item, "size", None)
     if size is None:
@@ -632,25 +783,39 @@ def _prepare_attachment_input(item: Any) -> Optional[Dict[str, Any]]:
         "data": decoded,
         "width": width,
         "height": height,
-        "size": size
+        "size": size,
+        "llm_image": llm_image,
+        "payload_base64": payload
     }
 
 
-def _convert_image_for_llm(data: bytes, mime: str) -> Optional[Tuple[str, bytes]]:
+def _image_has_alpha(img: Image.Image) -> bool:
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _encode_image(img: Image.Image, jpeg_quality: int) -> Tuple[str, bytes]:
+    """Encode as PNG when the image has transparency, otherwise as an RGB JPEG."""
+    output = BytesIO()
+    if _image_has_alpha(img):
+        if img.mode not in ("RGBA", "LA"):
+            img = img.convert("RGBA")
+        img.save(output, format="PNG")
+        return "image/png", output.getvalue()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.save(output, format="JPEG", quality=jpeg_quality)
+    return "image/jpeg", output.getvalue()
+
+
+def _convert_image_for_llm(img: Image.Image, data: bytes) -> Optional[Tuple[str, bytes]]:
     try:
-        with Image.open(BytesIO(data)) as img:
-            img.load()
-            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
-            output = BytesIO()
-            if has_alpha:
-                if img.mode not in ("RGBA", "LA"):
-                    img = img.convert("RGBA")
-                img.save(output, format="PNG")
-                return "image/png", output.getvalue()
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            img.save(output, format="JPEG", quality=92)
-            return "image/jpeg", output.getvalue()
+        # Already what _encode_image would produce: send the original bytes, no decode needed.
+        if img.format == "JPEG" and img.mode == "RGB":
+            return "image/jpeg", data
+        if img.format == "PNG" and _image_has_alpha(img):
+            return "image/png", data
+        img.load()
+        return _encode_image(img, jpeg_quality=92)
     except Exception:
         return None
 
@@ -666,27 +831,49 @@ def _build_llm_user_content(text: str, image_urls: List[str]) -> Any:
     return items
 
 
-def _collect_prepared_attachments(attachments: Optional[List[Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+def _prepare_attachment_with_url(item: Any) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+    prepared = _prepare_attachment_input(item)
+    if not prepared:
+        return None
+
+    converted = prepared.pop("llm_image", None)
+    payload = prepared.pop("payload_base64", "")
+    data = prepared.get("data") or b""
+    if not converted:
+        raw_mime = (prepared.get("mime") or "").lower()
+        if raw_mime in ("image/png", "image/jpeg", "image/jpg"):
+            mime = "image/jpeg" if raw_mime == "image/jpg" else raw_mime
+            converted = (mime, data)
+    data_url = None
+    if converted:
+        mime, out_data = converted
+        # Unconverted bytes: forward the client's base64 when it is already canonical (no whitespace).
+        if out_data is data and len(payload) == 4 * ((len(data) + 2) // 3):
+            encoded = payload
+        else:
+            encoded = binascii.b2a_base64(out_data, newline=False).decode("ascii")
+        data_url = f"data:{mime};base64,{encoded}"
+    return prepared, data_url
+
+
+async def _prepare_attachment_threaded(item: Any) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+    async with _ATTACHMENT_SEMAPHORE:
+        return await asyncio.to_thread(_prepare_attachment_with_url, item)
+
+
+async def _collect_prepared_attachments(attachments: Optional[List[Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
     prepared_items: List[Dict[str, Any]] = []
     llm_image_urls: List[str] = []
     if not attachments:
         return prepared_items, llm_image_urls
 
-    for item in attachments:
-        prepared = _prepare_attachment_input(item)
-        if not prepared:
+    results = await asyncio.gather(*(_prepare_attachment_threaded(item) for item in attachments))
+    for result in results:
+        if not result:
             continue
+        prepared, data_url = result
         prepared_items.append(prepared)
-
-        converted = _convert_image_for_llm(prepared.get("data") or b"", prepared.get("mime") or "")
-        if not converted:
-            raw_mime = (prepared.get("mime") or "").lower()
-            if raw_mime in ("image/png", "image/jpeg", "image/jpg"):
-                mime = "image/jpeg" if raw_mime == "image/jpg" else raw_mime
-                converted = (mime, prepared.get("data") or b"")
-        if converted:
-            mime, out_data = converted
-            data_url = f"data:{mime};base64,{base64.b64encode(out_data).decode('ascii')}"
+        if data_url:
             llm_image_urls.append(data_url)
 
     return prepared_items, llm_image_urls
@@ -711,38 +898,50 @@ def _save_prepared_attachments(message_id: int, prepared_items: List[Dict[str, A
 def _build_thumbnail(data: bytes, max_size: int = 360) -> Optional[Tuple[str, bytes]]:
     try:
         with Image.open(BytesIO(data)) as img:
-            img.load()
-            img.thumbnail((max_size, max_size))
-            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
-            output = BytesIO()
-            if has_alpha:
-                if img.mode not in ("RGBA", "LA"):
-                    img = img.convert("RGBA")
-                img.save(output, format="PNG")
-                return "image/png", output.getvalue()
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            img.save(output, format="JPEG", quality=85)
-            return "image/jpeg", output.getvalue()
+            # Small enough already: serve the original bytes without decoding any pixels.
+            if max(img.size) <= max_size:
+                if img.format == "JPEG" and img.mode in ("RGB", "L"):
+                    return "image/jpeg", data
+                if img.format == "PNG":
+                    return "image/png", data
+            # No explicit load(): thumbnail() can then draft a DCT-scaled JPEG decode.
+            img.thumbnail((max_size, max_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+            return _encode_image(img, jpeg_quality=85)
     except Exception:
         return None
 
 
+async def _await_unless_stopped(coro, stop_event: Optional[asyncio.Event], timeout: float):
+    """Await coro, cancelling it if stop_event fires or timeout elapses first."""
+    if stop_event is None:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    work = asyncio.ensure_future(coro)
+    stopper = asyncio.ensure_future(stop_event.wait())
+    try:
+        done, _ = await asyncio.wait({work, stopper}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if work in done:
+            return work.result()
+        if stop_event.is_set():
+            raise LLMRequestStopped("Request stopped")
+        raise asyncio.TimeoutError()
+    finally:
+        stopper.cancel()
+        # Also reached when the caller itself is cancelled; the request must not outlive its semaphore slot.
+        if not work.done():
+            work.cancel()
+
+
 async def _generate_title(
     config: LLMConfig,
     user_message: str,
     assistant_message: str,
     session_id: Optional[str] = None,
-    message_id: Optional[int] = None
+    message_id: Optional[int] = None,
+    stop_event: Optional[asyncio.Event] = None
 ) -> Optional[str]:
-    system_role = "developer" if config.api_profile == "openai" else "system"
-    system_prompt = (
-        "You generate concise chat titles. "
-        "Output only the title. "
-        "Use the user's language. "
-        "3-12 words or <=20 Chinese characters. "
-        "No quotes, no emojis, no trailing punctuation."
-    )
+    if stop_event is not None and stop_event.is_set():
+        return ""
+    system_role = _system_role_for(config)
     user_excerpt = _truncate_text(user_message, 600)
     assistant_excerpt = _truncate_text(assistant_message, 800)
     user_prompt = (
@@ -753,22 +952,35 @@ async def _generate_title(
         "Title:"
     )
     messages = [
-        {"role": system_role, "content": system_prompt},
+        {"role": system_role, "content": TITLE_SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt}
     ]
+
     client = create_llm_client(config)
     client.timeout = TITLE_REQUEST_TIMEOUT
-    request_overrides = None
+    request_overrides: Dict[str, Any] = {}
     if session_id:
-        request_overrides = {
-            "_debug": {
-                "session_id": session_id,
-                "message_id": message_id,
-                "agent_type": "title",
-                "iteration": 0
-            }
+        request_overrides["_debug"] = {
+            "session_id": session_id,
+            "message_id": message_id,
+            "agent_type": "title",
+            "iteration": 0
         }
-    result = await client.chat(messages, request_overrides)
+    if stop_event is not None:
+        request_overrides["_stop_event"] = stop_event
+
+    async def _request_title() -> Dict[str, Any]:
+        async with _TITLE_REQUEST_SEMAPHORE:
+            return await _await_unless_stopped(
+                client.chat(messages, request_overrides or None),
+                stop_event,
+                TITLE_REQUEST_TIMEOUT
+            )
+
+    cache_key = llm_response_cache.make_key(config, messages, scope="title", force=True)
+    result = await llm_response_cache.get_or_fetch(cache_key, _request_title)
+    if session_id and request_overrides["_debug"].get("llm_call_id") is None:
+        await _db_write(client.record_shared_response, messages, request_overrides, result)
     raw_content = result.get("content", "") if isinstance(result, dict) else ""
     parsed_title = _parse_title_json(raw_content)
     if parsed_title:
@@ -784,39 +996,42 @@ async def _maybe_update_session_title(
     user_message: str,
     assistant_message: str,
     is_first_turn: bool,
-    assistant_message_id: Optional[int] = None
+    assistant_message_id: Optional[int] = None,
+    stop_event: Optional[asyncio.Event] = None
 ) -> None:
     if not is_first_turn:
         return
-    current = db.get_session(session_id)
+    current = await asyncio.to_thread(db.get_session, session_id)
     if not current or not is_first_turn:
         return
     current_title = (current.title or "").strip()
     provisional_title = _fallback_title(user_message)
     if current_title not in ("New Chat", provisional_title):
         return
-    app_config = get_app_config()
-    llm_app_config = app_config.get("llm", {}) if isinstance(app_config, dict) else {}
-    auto_title_enabled = llm_app_config.get("auto_title_enabled", True)
-    if not auto_title_enabled:
+    if not get_app_config_view().auto_title_enabled:
         if provisional_title and provisional_title != current.title:
-            db.update_session(session_id, ChatSessionUpdate(title=provisional_title))
+            await _db_write(db.update_session, session_id, ChatSessionUpdate(title=provisional_title))
         return
-    title = ""
-    try:
-        title = await _generate_title(
-            config,
-            user_message,
-            assistant_message,
-            session_id=session_id,
-            message_id=assistant_message_id
-        )
-    except Exception:
-        title = ""
+    title_scope = str(config.model or "")
+    title = title_similarity_cache.lookup(title_scope, user_message) or ""
+    if not title:
+        try:
+            title = await _generate_title(
+                config,
+                user_message,
+                assistant_message,
+                session_id=session_id,
+                message_id=assistant_message_id,
+                stop_event=stop_event
+            )
+        except Exception:
+            title = ""
+        if title:
+            title_similarity_cache.add(title_scope, user_message, title)
     if not title:
         title = _fallback_title(user_message)
     if title and title != current.title:
-        db.update_session(session_id, ChatSessionUpdate(title=title))
+        await _db_write(db.update_session, session_id, ChatSessionUpdate(title=title))
 
 # ==================== Base routes ====================
 
@@ -1218,100 +1433,168 @@ async def cancel_task_route(task_id: str, request: AgentTaskCancelRequest):
 
 # ==================== Attachments ====================
 
-@app.get("/attachments/{attachment_id}")
-def get_attachment(attachment_id: int, thumbnail: bool = False, max_size: int = 360):
+THUMBNAIL_CACHE_MAX_ENTRIES = 512
+THUMBNAIL_CACHE_CONTROL = "private, max-age=86400"
+THUMBNAIL_MAX_SIZE_LIMIT = 2048
+
+
+def _load_attachment(attachment_id: int) -> Tuple[str, bytes]:
     attachment = db.get_attachment(attachment_id)
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
-
     data = attachment.get("data") or b""
     if isinstance(data, memoryview):
         data = data.tobytes()
-    mime = attachment.get("mime") or "application/octet-stream"
-    if thumbnail:
-        thumb = _build_thumbnail(data, max_size=max_size)
-        if thumb:
-            mime, data = thumb
-    return Response(content=data, media_type=mime)
+    return attachment.get("mime") or "application/octet-stream", data
+
+
+@lru_cache(maxsize=THUMBNAIL_CACHE_MAX_ENTRIES)
+def _cached_thumbnail(attachment_id: int, max_size: int) -> Optional[Tuple[str, Optional[bytes]]]:
+    # Attachment ids are AUTOINCREMENT and rows are never updated, so (id, size) pins the content.
+    # None (not an image, or undecodable) is cached too. When the original is already small enough
+    # only its mime type is kept (bytes None), so the cache never holds full originals.
+    _, data = _load_attachment(attachment_id)
+    thumb = _build_thumbnail(data, max_size=max_size)
+    if thumb is not None and thumb[1] is data:
+        return thumb[0], None
+    return thumb
+
+
+def _thumbnail_or_original(attachment_id: int, max_size: int) -> Tuple[str, bytes]:
+    thumb = _cached_thumbnail(attachment_id, max_size)
+    if thumb is None:
+        return _load_attachment(attachment_id)
+    mime, data = thumb
+    if data is None:
+        _, data = _load_attachment(attachment_id)
+    return mime, data
+
+
+@app.get("/attachments/{attachment_id}")
+async def get_attachment(attachment_id: int, request: Request, thumbnail: bool = False, max_size: int = 360):
+    if not thumbnail:
+        mime, data = await asyncio.to_thread(_load_attachment, attachment_id)
+        return Response(content=data, media_type=mime)
+
+    if not 1 <= max_size <= THUMBNAIL_MAX_SIZE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_size must be between 1 and {THUMBNAIL_MAX_SIZE_LIMIT}")
+    # Cached thumbnails outlive deleted rows, so confirm the attachment still exists.
+    if not await asyncio.to_thread(db.attachment_exists, attachment_id):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    etag = f'"{attachment_id:x}-{max_size}"'
+    headers = {"Cache-Control": THUMBNAIL_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    # Decoding and resampling are CPU-bound; keep them off the event loop.
+    mime, data = await asyncio.to_thread(_thumbnail_or_original, attachment_id, max_size)
+    return Response(content=data, media_type=mime, headers=headers)
 
 # ==================== Chat ====================
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    try:
-        new_session_created = False
-        if request.session_id:
-            session = db.get_session(request.session_id)
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-            if request.agent_profile is not None and request.agent_profile != getattr(session, "agent_profile", None):
-                session = db.update_session(session.id, ChatSessionUpdate(agent_profile=request.agent_profile)) or session
-        else:
-            config_id = request.config_id
-            if not config_id:
-                default_config = db.get_default_config()
-                if not default_config:
-                    configs = db.get_all_configs()
-                    if not configs:
-                        raise HTTPException(status_code=400, detail="No config available")
-                    config_id = configs[0].id
-                else:
-                    config_id = default_config.id
+@dataclass
+class _ChatTurnContext:
+    session: ChatSession
+    config: LLMConfig
+    processed_message: str
+    is_first_turn: bool
+    prepared_attachments: List[Dict[str, Any]]
+    llm_messages: List[Dict[str, Any]]
+    raw_request_data: Dict[str, Any]
+
+
+async def _prepare_chat_turn(request: ChatRequest, *, stream: bool) -> _ChatTurnContext:
+    """Resolve the session and config and build the LLM request shared by /chat and /chat/stream."""
+    processed_message = message_processor.preprocess_user_message(request.message)
+    history = []
+    config = None
+    if request.session_id:
+        session, config, history = await asyncio.to_thread(
+            db.get_session_bundle, request.session_id, CHAT_HISTORY_LIMIT
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if request.agent_profile is not None and request.agent_profile != getattr(session, "agent_profile", None):
+            session = db.update_session(session.id, ChatSessionUpdate(agent_profile=request.agent_profile)) or session
+    else:
+        config_id = request.config_id
+        if not config_id:
+            default_config = db.get_default_config()
+            if not default_config:
+                configs = db.get_all_configs()
+                if not configs:
+                    raise HTTPException(status_code=400, detail="No config available")
+                config_id = configs[0].id
+            else:
+                config_id = default_config.id
+
+        # The provisional title goes into the INSERT rather than a follow-up UPDATE.
+        session = db.create_session(ChatSessionCreate(
+            title=_fallback_title(processed_message),
+            config_id=config_id,
+            work_path=request.work_path,
+            agent_profile=request.agent_profile
+        ))
+        _schedule_ast_scan(session.work_path)
+    is_first_turn = (session.message_count or 0) == 0
 
-            session = db.create_session(ChatSessionCreate(
-                title="New Chat",
-                config_id=config_id,
-                work_path=request.work_path,
-                agent_profile=request.agent_profile
-            ))
-            new_session_created = True
-            _schedule_ast_scan(session.work_path)
-        is_first_turn = (session.message_count or 0) == 0
+    if config is None:
+        config = await asyncio.to_thread(db.get_config, session.config_id)
+    if not config:
+        raise HTTPException(status_code=404, detail="Config not found")
 
-        config = db.get_config(session.config_id)
-        if not config:
-            raise HTTPException(status_code=404, detail="Config not found")
+    prepared_attachments, llm_image_urls = await _collect_prepared_attachments(request.attachments)
 
-        processed_message = message_processor.preprocess_user_message(request.message)
-        if new_session_created:
-            provisional_title = _fallback_title(processed_message)
-            if provisional_title and provisional_title != session.title:
-                db.update_session(session.id, ChatSessionUpdate(title=provisional_title))
+    history_for_llm = [
+        {"role": msg.role, "content": msg.content}
+        for msg in history
+    ]
+    llm_messages = message_processor.build_messages_for_llm(
+        user_message=processed_message,
+        history=history_for_llm,
+        system_prompt=CHAT_SYSTEM_PROMPT,
+        max_history=CHAT_HISTORY_LIMIT,
+        system_role=_system_role_for(config)
+    )
+    if llm_image_urls:
+        llm_messages[-1]["content"] = _build_llm_user_content(processed_message, llm_image_urls)
+
+    raw_request_data = {
+        "model": config.model,
+        "messages": llm_messages,
+        "temperature": config.temperature,
+        "max_tokens": config.max_tokens,
+    }
+    if stream:
+        raw_request_data["stream"] = True
+    raw_request_data["api_format"] = config.api_format
+    raw_request_data["api_profile"] = config.api_profile
+
+    return _ChatTurnContext(
+        session=session,
+        config=config,
+        processed_message=processed_message,
+        is_first_turn=is_first_turn,
+        prepared_attachments=prepared_attachments,
+        llm_messages=llm_messages,
+        raw_request_data=raw_request_data
+    )
 
-        prepared_attachments, llm_image_urls = _collect_prepared_attachments(request.attachments)
-        user_content = _build_llm_user_content(processed_message, llm_image_urls)
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+    try:
+        turn = await _prepare_chat_turn(request, stream=False)
+        session = turn.session
+        config = turn.config
+        processed_message = turn.processed_message
+        llm_messages = turn.llm_messages
 
         user_msg = db.create_message(ChatMessageCreate(
             session_id=session.id,
             role="user",
             content=processed_message
         ))
-        _save_prepared_attachments(user_msg.id, prepared_attachments)
-
-        history = db.get_session_messages(session.id, limit=20)
-        history_for_llm = [
-            {"role": msg.role, "content": msg.content}
-            for msg in history[:-1]
-        ]
-
-        system_role = "developer" if config.api_profile == "openai" else "system"
-        llm_messages = message_processor.build_messages_for_llm(
-            user_message=processed_message,
-            history=history_for_llm,
-            system_prompt="You are a helpful AI assistant.",
-            system_role=system_role
-        )
-        if llm_image_urls:
-            llm_messages[-1]["content"] = user_content
-
-        raw_request_data = {
-            "model": config.model,
-            "messages": llm_messages,
-            "temperature": config.temperature,
-            "max_tokens": config.max_tokens,
-            "api_format": config.api_format,
-            "api_profile": config.api_profile
-        }
+        _save_prepared_attachments(user_msg.id, turn.prepared_attachments)
 
         llm_client = create_llm_client(config)
         llm_overrides = {}
@@ -1321,7 +1604,18 @@ async def chat(request: ChatRequest):
             "agent_type": "simple",
             "iteration": 0
         }
-        llm_result = await llm_client.chat(llm_messages, llm_overrides)
+
+        async def _request_chat() -> Dict[str, Any]:
+            return await llm_client.chat(llm_messages, llm_overrides)
+
+        # Identical deterministic requests already in flight are joined rather than re-sent.
+        cache_key = llm_response_cache.make_key(config, llm_messages, scope="chat")
+        llm_result = await llm_response_cache.get_or_fetch(cache_key, _request_chat)
+        llm_call_id = llm_overrides["_debug"].get("llm_call_id")
+        if llm_call_id is None:
+            # Served from the cache or another session's request: this session still needs its own
+            # llm_calls row, which context compression uses for its boundaries.
+            llm_call_id = await _db_write(llm_client.record_shared_response, llm_messages, llm_overrides, llm_result)
 
         llm_response = llm_result["content"]
         raw_response_data = llm_result["raw_response"]
@@ -1332,19 +1626,19 @@ async def chat(request: ChatRequest):
             session_id=session.id,
             role="assistant",
             content=processed_response,
-            raw_request=raw_request_data,
+            raw_request=turn.raw_request_data,
             raw_response=raw_response_data
         ))
-        llm_call_id = llm_result.get("llm_call_id")
         if llm_call_id:
-            db.update_llm_call_processed(llm_call_id, {"content": processed_response})
+            background_tasks.add_task(db.update_llm_call_processed, llm_call_id, {"content": processed_response})
 
-        await _maybe_update_session_title(
+        background_tasks.add_task(
+            _maybe_update_session_title,
             session_id=session.id,
             config=config,
             user_message=processed_message,
             assistant_message=processed_response,
-            is_first_turn=is_first_turn,
+            is_first_turn=turn.is_first_turn,
             assistant_message_id=assistant_msg.id
         )
 
@@ -1362,75 +1656,35 @@ async def chat(request: ChatRequest):
 @app.post("/chat/stream")
 async def chat_stream(request: ChatRequest):
     try:
-        new_session_created = False
-        if request.session_id:
-            session = db.get_session(request.session_id)
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-            if request.agent_profile is not None and request.agent_profile != getattr(session, "agent_profile", None):
-                session = db.update_session(session.id, ChatSessionUpdate(agent_profile=request.agent_profile)) or session
-        else:
-            config_id = request.config_id if request.config_id else db.get_all_configs()[0].id
-            session = db.create_session(ChatSessionCreate(
-                title="New Chat",
-                config_id=config_id,
-                work_path=request.work_path,
-                agent_profile=request.agent_profile
+        turn = await _prepare_chat_turn(request, stream=True)
+        session = turn.session
+        config = turn.config
+        processed_message = turn.processed_message
+        llm_messages = turn.llm_messages
+
+        def _persist_user_message():
+            created = db.create_message(ChatMessageCreate(
+                session_id=session.id,
+                role="user",
+                content=processed_message,
+                raw_request=turn.raw_request_data
             ))
-            new_session_created = True
-            _schedule_ast_scan(session.work_path)
-        is_first_turn = (session.message_count or 0) == 0
-
-        config = db.get_config(session.config_id)
-        if not config:
-            raise HTTPException(status_code=404, detail="Config not found")
+            return created, _save_prepared_attachments(created.id, turn.prepared_attachments)
 
-        processed_message = message_processor.preprocess_user_message(request.message)
-        if new_session_created:
-            provisional_title = _fallback_title(processed_message)
-            if provisional_title and provisional_title != session.title:
-                db.update_session(session.id, ChatSessionUpdate(title=provisional_title))
+        # Start the user write off the event loop now so it still lands if the client disconnects,
+        # while the response headers go out without waiting on SQLite.
+        user_write_task = asyncio.create_task(_db_write(_persist_user_message))
 
-        prepared_attachments, llm_image_urls = _collect_prepared_attachments(request.attachments)
-        user_content = _build_llm_user_content(processed_message, llm_image_urls)
-
-        history = db.get_session_messages(session.id, limit=20)
-        history_for_llm = [
-            {"role": msg.role, "content": msg.content}
-            for msg in history
-        ]
-
-        system_role = "developer" if config.api_profile == "openai" else "system"
-        llm_messages = message_processor.build_messages_for_llm(
-            user_message=processed_message,
-            history=history_for_llm,
-            system_prompt="You are a helpful AI assistant.",
-            system_role=system_role
-        )
-        if llm_image_urls:
-            llm_messages[-1]["content"] = user_content
-
-        raw_request_data = {
-            "model": config.model,
-            "messages": llm_messages,
-            "temperature": config.temperature,
-            "max_tokens": config.max_tokens,
-            "stream": True,
-            "api_format": config.api_format,
-            "api_profile": config.api_profile
-        }
-
-        user_msg = db.create_message(ChatMessageCreate(
-            session_id=session.id,
-            role="user",
-            content=processed_message,
-            raw_request=raw_request_data
-        ))
-        saved_attachments = _save_prepared_attachments(user_msg.id, prepared_attachments)
+        stream_background = BackgroundTasks()
 
         async def generate():
-            yield f"data: {json.dumps({'session_id': session.id, 'user_message_id': user_msg.id, 'user_attachments': saved_attachments})}\n\n"
-            full_response = ""
+            try:
+                user_msg, saved_attachments = await user_write_task
+            except Exception as e:
+                yield encode_sse_data({'error': str(e)})
+                return
+            yield encode_sse_data({'session_id': session.id, 'user_message_id': user_msg.id, 'user_attachments': saved_attachments})
+            response_parts: List[str] = []
             try:
                 llm_client = create_llm_client(config)
                 llm_overrides = {}
@@ -1442,10 +1696,10 @@ async def chat_stream(request: ChatRequest):
                 }
 
                 async for chunk in llm_client.chat_stream(llm_messages, llm_overrides):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
+                    response_parts.append(chunk)
+                    yield encode_sse_content(chunk)
 
-                processed_response = message_processor.postprocess_llm_response(full_response)
+                processed_response = message_processor.postprocess_llm_response("".join(response_parts))
 
                 assistant_msg = db.create_message(ChatMessageCreate(
                     session_id=session.id,
@@ -1459,32 +1713,34 @@ async def chat_stream(request: ChatRequest):
                 ))
                 llm_call_id = llm_overrides.get("_debug", {}).get("llm_call_id")
                 if llm_call_id:
-                    db.update_llm_call_processed(llm_call_id, {"content": processed_response})
+                    stream_background.add_task(db.update_llm_call_processed, llm_call_id, {"content": processed_response})
 
-                await _maybe_update_session_title(
+                stream_background.add_task(
+                    _maybe_update_session_title,
                     session_id=session.id,
                     config=config,
                     user_message=processed_message,
                     assistant_message=processed_response,
-                    is_first_turn=is_first_turn,
+                    is_first_turn=turn.is_first_turn,
                     assistant_message_id=assistant_msg.id
                 )
 
-                yield f"data: {json.dumps({'done': True, 'message_id': assistant_msg.id})}\n\n"
+                yield encode_sse_data({'done': True, 'message_id': assistant_msg.id})
             except Exception as e:
-                if full_response:
+                if response_parts:
                     db.create_message(ChatMessageCreate(
                         session_id=session.id,
                         role="assistant",
-                        content=full_response + "\n\n[stream interrupted]",
+                        content="".join(response_parts) + "\n\n[stream interrupted]",
                         metadata={"error": str(e), "partial": True}
                     ))
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                yield encode_sse_data({'error': str(e)})
 
         return StreamingResponse(
             generate(),
             media_type="text/event-stream",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+            headers=SSE_HEADERS,
+            background=stream_background
         )
 
     except Exception as e:
@@ -1492,8 +1748,128 @@ async def chat_stream(request: ChatRequest):
 
 # ==================== Export ====================
 
+EXPORT_GZIP_LEVEL = 6
+EXPORT_SESSION_BATCH = 100
+EXPORT_MEDIA_TYPES = {
+    "json": ("application/json", "json"),
+    "txt": ("text/plain; charset=utf-8", "txt"),
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+}
+
+
+def _accepts_gzip(http_request: Optional[Request]) -> bool:
+    if http_request is None:
+        return False
+    accept_encoding = http_request.headers.get("accept-encoding", "")
+    return "gzip" in accept_encoding.lower()
+
+
+def _iter_export_sessions(
+    sessions: List[ChatSession],
+    configs: Dict[str, LLMConfig],
+    first_batch_messages: Dict[str, List[Dict[str, Any]]]
+):
+    # Messages are fetched a batch of sessions at a time, so memory stays bounded while streaming.
+    # The first batch is loaded by the handler, so errors there still become a 500.
+    messages_by_session = first_batch_messages
+    for start in range(0, len(sessions), EXPORT_SESSION_BATCH):
+        batch = sessions[start:start + EXPORT_SESSION_BATCH]
+        if start:
+            try:
+                messages_by_session = db.get_messages_for_export([session.id for session in batch])
+            except Exception as exc:
+                # Headers are already sent. Re-raising aborts the connection before the final chunk,
+                # so the client sees a failed download rather than a well-formed truncated file.
+                print(f"[Export] Failed to load messages mid-stream: {exc}")
+                raise
+        for session in batch:
+            yield _export_session_data(session, configs.get(session.config_id), messages_by_session[session.id])
+
+
+def _export_session_data(
+    session: ChatSession,
+    config: Optional[LLMConfig],
+    messages: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    return {
+        "session": {
+            "id": session.id,
+            "title": session.title,
+            "created_at": session.created_at,
+            "context_summary": getattr(session, "context_summary", None),
+            "last_compressed_llm_call_id": getattr(session, "last_compressed_llm_call_id", None),
+            "config": {
+                "name": config.name if config else "unknown",
+                "model": config.model if config else "unknown"
+            }
+        },
+        "messages": messages
+    }
+
+
+def _dump_export_session(session_data: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(session_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(session_data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _iter_export_json(session_iter):
+    yield b"["
+    first = True
+    for session_data in session_iter:
+        yield b"\n" if first else b",\n"
+        first = False
+        yield _dump_export_session(session_data)
+    yield b"\n]" if not first else b"]"
+
+
+def _iter_export_txt(session_iter):
+    for session_data in session_iter:
+        session_info = session_data["session"]
+        lines = [
+            f"========== {session_info['title']} ==========",
+            f"Created: {session_info['created_at']}",
+            f"Config: {session_info['config']['name']} ({session_info['config']['model']})"
+        ]
+        if session_info.get("context_summary"):
+            lines.extend(["Context Summary:", session_info["context_summary"], ""])
+        lines.append("")
+        for msg in session_data["messages"]:
+            role_name = "User" if msg["role"] == "user" else "Assistant"
+            lines.extend([f"[{msg['timestamp']}] {role_name}:", msg["content"], ""])
+        lines.append("\n")
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _iter_export_markdown(session_iter):
+    for session_data in session_iter:
+        session_info = session_data["session"]
+        lines = [
+            f"# {session_info['title']}",
+            f"\n**Created:** {session_info['created_at']}",
+            f"**Config:** {session_info['config']['name']} ({session_info['config']['model']})"
+        ]
+        if session_info.get("context_summary"):
+            lines.extend(["\n**Context Summary:**", session_info["context_summary"]])
+        lines.append("\n---\n")
+        for msg in session_data["messages"]:
+            role_name = "User" if msg["role"] == "user" else "Assistant"
+            lines.extend([f"## {role_name}", f"*{msg['timestamp']}*\n", msg["content"], "\n"])
+        lines.append("\n---\n")
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _iter_gzip(chunks):
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 @app.post("/export")
-def export_chat_history(request: ExportRequest):
+def export_chat_history(request: ExportRequest, http_request: Request):
     try:
         if request.session_id:
             session = db.get_session(request.session_id)
@@ -1503,86 +1879,32 @@ def export_chat_history(request: ExportRequest):
         else:
             sessions = db.get_all_sessions()
 
-        export_data = []
-        for session in sessions:
-            messages = db.get_session_messages(session.id)
-            config = db.get_config(session.config_id)
-
-            session_data = {
-                "session": {
-                    "id": session.id,
-                    "title": session.title,
-                    "created_at": session.created_at,
-                    "context_summary": getattr(session, "context_summary", None),
-                    "last_compressed_llm_call_id": getattr(session, "last_compressed_llm_call_id", None),
-                    "config": {
-                        "name": config.name if config else "unknown",
-                        "model": config.model if config else "unknown"
-                    }
-                },
-                "messages": [
-                    {
-                        "role": msg.role,
-                        "content": msg.content,
-                        "timestamp": msg.timestamp
-                    }
-                    for msg in messages
-                ]
-            }
-            export_data.append(session_data)
+        if request.format not in EXPORT_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail="Unsupported export format")
+        media_type, extension = EXPORT_MEDIA_TYPES[request.format]
+        filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
 
+        configs = {config.id: config for config in db.get_all_configs()}
+        first_batch_messages = db.get_messages_for_export(
+            [session.id for session in sessions[:EXPORT_SESSION_BATCH]]
+        )
+        session_iter = _iter_export_sessions(sessions, configs, first_batch_messages)
         if request.format == "json":
-            content = json.dumps(export_data, ensure_ascii=False, indent=2)
-            media_type = "application/json"
-            filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            body = _iter_export_json(session_iter)
         elif request.format == "txt":
-            lines = []
-            for session_data in export_data:
-                lines.append(f"========== {session_data['session']['title']} ==========")
-                lines.append(f"Created: {session_data['session']['created_at']}")
-                lines.append(f"Config: {session_data['session']['config']['name']} ({session_data['session']['config']['model']})")
-                if session_data["session"].get("context_summary"):
-                    lines.append("Context Summary:")
-                    lines.append(session_data["session"]["context_summary"])
-                    lines.append("")
-                lines.append("")
-                for msg in session_data['messages']:
-                    role_name = "User" if msg['role'] == "user" else "Assistant"
-                    lines.append(f"[{msg['timestamp']}] {role_name}:")
-                    lines.append(msg['content'])
-                    lines.append("")
-                lines.append("\n")
-            content = "\n".join(lines)
-            media_type = "text/plain"
-            filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        elif request.format == "markdown":
-            lines = []
-            for session_data in export_data:
-                lines.append(f"# {session_data['session']['title']}")
-                lines.append(f"\n**Created:** {session_data['session']['created_at']}")
-                lines.append(f"**Config:** {session_data['session']['config']['name']} ({session_data['session']['config']['model']})")
-                if session_data["session"].get("context_summary"):
-                    lines.append("\n**Context Summary:**")
-                    lines.append(session_data["session"]["context_summary"])
-                lines.append("\n---\n")
-                for msg in session_data['messages']:
-                    role_name = "User" if msg['role'] == "user" else "Assistant"
-                    lines.append(f"## {role_name}")
-                    lines.append(f"*{msg['timestamp']}*\n")
-                    lines.append(msg['content'])
-                    lines.append("\n")
-                lines.append("\n---\n")
-            content = "\n".join(lines)
-            media_type = "text/markdown"
-            filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+            body = _iter_export_txt(session_iter)
         else:
-            raise HTTPException(status_code=400, detail="Unsupported export format")
+            body = _iter_export_markdown(session_iter)
 
-        return Response(
-            content=content,
-            media_type=media_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        if _accepts_gzip(http_request):
+            body = _iter_gzip(body)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+
+        # Sessions, configs and the first batch of messages are loaded above; later batches are
+        # loaded and encoded while the response is sent.
+        return StreamingResponse(body, media_type=media_type, headers=headers)
 
     except HTTPException:
         raise
@@ -1592,7 +1914,6 @@ def export_chat_history(request: ExportRequest):
 # ==================== Agent Chat (Streaming) ====================
 
 async def _run_agent_stream(request: ChatRequest, state) -> None:
-    new_session_created = False
     assistant_msg_id = None
     stop_event = None
     had_error = False
@@ -1600,8 +1921,10 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
     session = None
     try:
         await state.emit({"stream_id": state.stream_id})
+        processed_message = message_processor.preprocess_user_message(request.message)
+        config = None
         if request.session_id:
-            session = db.get_session(request.session_id)
+            session, config, _ = await asyncio.to_thread(db.get_session_bundle, request.session_id)
             if not session:
                 raise HTTPException(status_code=404, detail="Session not found")
             if request.agent_profile is not None and request.agent_profile != getattr(session, "agent_profile", None):
@@ -1609,26 +1932,20 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
         else:
             config_id = request.config_id or db.get_default_config().id
             session = db.create_session(ChatSessionCreate(
-                title="New Chat",
+                title=_fallback_title(processed_message),
                 config_id=config_id,
                 work_path=request.work_path,
                 agent_profile=request.agent_profile
             ))
-            new_session_created = True
         parent_session_id = session.id
         is_first_turn = (session.message_count or 0) == 0
 
-        config = db.get_config(session.config_id)
+        if config is None:
+            config = db.get_config(session.config_id)
         if not config:
             raise HTTPException(status_code=404, detail="Config not found")
 
-        processed_message = message_processor.preprocess_user_message(request.message)
-        if new_session_created:
-            provisional_title = _fallback_title(processed_message)
-            if provisional_title and provisional_title != session.title:
-                db.update_session(session.id, ChatSessionUpdate(title=provisional_title))
-
-        prepared_attachments, llm_image_urls = _collect_prepared_attachments(request.attachments)
+        prepared_attachments, llm_image_urls = await _collect_prepared_attachments(request.attachments)
         user_content = _build_llm_user_content(processed_message, llm_image_urls)
 
         user_msg = db.create_message(ChatMessageCreate(
@@ -1645,12 +1962,11 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
             int(last_compressed_call_id or 0)
         ) if last_compressed_call_id else None
 
-        app_config = get_app_config()
-        llm_app_config = app_config.get("llm", {}) if isinstance(app_config, dict) else {}
-        global_reasoning_summary = llm_app_config.get("reasoning_summary")
+        app_view = get_app_config_view()
+        global_reasoning_summary = app_view.reasoning_summary
         if global_reasoning_summary:
             try:
-                config.reasoning_summary = str(global_reasoning_summary)
+                config.reasoning_summary = global_reasoning_summary
             except Exception:
                 pass
 
@@ -1680,22 +1996,8 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
             db.update_session(session.id, ChatSessionUpdate(agent_profile=resolved_profile_id))
 
         llm_client = create_llm_client(config)
-        agent_config = app_config.get("agent", {}) if isinstance(app_config, dict) else {}
-        context_config = app_config.get("context", {}) if isinstance(app_config, dict) else {}
-        ast_enabled = bool(agent_config.get("ast_enabled", True))
-        code_map_cfg = agent_config.get("code_map", {}) if isinstance(agent_config, dict) else {}
-        code_map_enabled = bool(code_map_cfg.get("enabled", True))
-        code_map_prompt = None
-        if "code_map" in ability_ids and ast_enabled and code_map_enabled:
-            code_map_prompt = build_code_map_prompt(
-                session.id,
-                request.work_path or getattr(session, "work_path", None)
-            )
-        react_max_iterations = agent_config.get("react_max_iterations", 50)
-        try:
-            react_max_iterations = int(react_max_iterations)
-        except (TypeError, ValueError):
-            react_max_iterations = 50
+        code_map_enabled = "code_map" in ability_ids and app_view.ast_enabled and app_view.code_map_enabled
+        react_max_iterations = app_view.react_max_iterations
 
         try:
             executor = create_agent_executor(
@@ -1708,35 +2010,40 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-        def stream_text_chunks(text: str, chunk_size: int = 1):
-            if not text:
-                return
-            for i in range(0, len(text), chunk_size):
-                yield text[i:i + chunk_size]
-
         sequence = 0
         final_answer = None
         saw_delta = False
 
-        prompt_truncation_cfg = {
-            "enabled": bool(context_config.get("truncate_long_data", True)),
-            "threshold": int(context_config.get("long_data_threshold", 4000) or 4000),
-            "head_chars": int(context_config.get("long_data_head_chars", 1200) or 1200),
-            "tail_chars": int(context_config.get("long_data_tail_chars", 800) or 800)
-        }
+        prompt_truncation_cfg = get_context_config().truncation_cfg()
 
-        pending_compress_step = None
-        if agent_type != "react":
-            updated_summary, updated_call_id, updated_message_id, did_compress = await maybe_compress_context(
+        async def _build_code_map() -> Optional[str]:
+            if not code_map_enabled:
+                return None
+            return await asyncio.to_thread(
+                build_code_map_prompt,
+                session.id,
+                request.work_path or getattr(session, "work_path", None)
+            )
+
+        async def _compress_context():
+            if agent_type == "react":
+                return None
+            return await maybe_compress_context(
                 session_id=session.id,
                 config=config,
-                app_config=app_config,
                 llm_client=llm_client,
                 current_summary=context_summary,
                 last_compressed_call_id=last_compressed_call_id,
                 current_user_message_id=user_msg.id,
                 current_user_text=processed_message
             )
+
+        # The code map scan (file I/O) is independent of the compression check (which may call the LLM).
+        code_map_prompt, compress_result = await asyncio.gather(_build_code_map(), _compress_context())
+
+        pending_compress_step = None
+        if compress_result is not None:
+            updated_summary, updated_call_id, updated_message_id, did_compress = compress_result
             if did_compress:
                 context_summary = updated_summary
                 last_compressed_call_id = updated_call_id
@@ -1847,113 +2154,111 @@ async def _run_agent_stream(request: ChatRequest, state) -> None:
                 await step_queue.put(None)
 
         producer_task = asyncio.create_task(_produce_steps())
+        step_writer = _AgentStepWriter(assistant_msg_id)
         try:
             while True:
                 step = await step_queue.get()
                 if step is None:
                     break
 
-                if step.step_type == "context_estimate":
+                step_dict = step.to_dict()
+                step_type = step.step_type
+                step_metadata = step.metadata if isinstance(step.metadata, dict) else {}
+
+                if step_type == "context_estimate":
                     try:
                         db.update_session_context_estimate(session.id, step.metadata)
                     except Exception as exc:
                         print(f"[Context Estimate] Failed to update session: {exc}")
-                    await state.emit(step.to_dict())
+                    await state.emit(step_dict)
                     continue
 
-                if step.step_type.endswith("_delta"):
+                if step_type.endswith("_delta"):
                     saw_delta = True
-                    await state.emit(step.to_dict())
+                    await state.emit(step_dict)
                     continue
                 suppress_prompt = False
-                if step.step_type == "error":
+                if step_type == "error":
                     had_error = True
-                    suppress_prompt = bool(step.metadata.get("suppress_prompt")) if isinstance(step.metadata, dict) else False
+                    suppress_prompt = bool(step_metadata.get("suppress_prompt"))
 
                 if suppress_prompt:
-                    await state.emit(step.to_dict())
+                    await state.emit(step_dict)
                     continue
 
-                db.save_agent_step(
-                    message_id=assistant_msg_id,
-                    step_type=step.step_type,
-                    content=step.content,
-                    sequence=sequence,
-                    metadata=step.metadata
-                )
+                if step_writer.add(step_type, step.content, sequence, step.metadata) or step_type in ("answer", "error"):
+                    await step_writer.flush()
 
-                if step.step_type == "action" and "tool" in step.metadata:
-                    db.save_tool_call(
+                tool_name = step_metadata.get("tool")
+                if step_type == "action" and tool_name is not None:
+                    await _db_write(
+                        db.save_tool_call,
                         message_id=assistant_msg_id,
-                        tool_name=step.metadata["tool"],
-                        tool_input=step.metadata.get("input", ""),
+                        tool_name=tool_name,
+                        tool_input=step_metadata.get("input", ""),
                         tool_output=""
                     )
 
-                if step.step_type == "answer":
+                if step_type == "answer":
                     final_answer = step.content
                     if not saw_delta:
-                        for chunk in stream_text_chunks(step.content, chunk_size=1):
+                        for chunk in _stream_text_chunks(step.content):
                             await state.emit({"step_type": "answer_delta", "content": chunk, "metadata": step.metadata})
-                    await state.emit(step.to_dict())
+                    await state.emit(step_dict)
                     sequence += 1
                     continue
 
-                if step.step_type == "error":
+                if step_type == "error":
                     final_answer = step.content
 
-                await state.emit(step.to_dict())
+                await state.emit(step_dict)
                 sequence += 1
         finally:
-            if producer_task and not producer_task.done():
-                producer_task.cancel()
-                try:
-                    await producer_task
-                except Exception:
-                    pass
+            # Flush before awaiting the producer: a cancelled producer raises CancelledError, which
+            # would skip anything after it. Failure handling also numbers its error step from the
+            # saved rows, so nothing may stay buffered.
+            try:
+                await step_writer.flush_logged()
+            finally:
+                if producer_task and not producer_task.done():
+                    producer_task.cancel()
+                    try:
+                        await producer_task
+                    except Exception:
+                        pass
 
         if producer_error is not None:
             raise producer_error
 
         if final_answer and assistant_msg_id:
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE chat_messages
-                SET content = ?
-                WHERE id = ?
-            ''', (final_answer, assistant_msg_id))
-            conn.commit()
-            conn.close()
-
-            await _maybe_update_session_title(
+            await _db_write(db.update_message_content, assistant_msg_id, final_answer)
+
+            # The title is not part of the answer; let the client see "done" first.
+            _spawn_background(_maybe_update_session_title(
                 session_id=session.id,
                 config=config,
                 user_message=processed_message,
                 assistant_message=final_answer,
                 is_first_turn=is_first_turn,
-                assistant_message_id=assistant_msg_id
-            )
+                assistant_message_id=assistant_msg_id,
+                stop_event=stop_event
+            ))
 
         await state.emit({"done": True, "session_id": session.id})
 
     except Exception as e:
         had_error = True
         error_text = f"Agent failed: {str(e)}"
-        error_metadata = {"error": str(e), "traceback": traceback.format_exc()}
+        error_metadata = {"error": str(e), "traceback": _format_agent_error_traceback(e)}
         assistant_msg_id = _persist_agent_failure_message(
             session.id if session else parent_session_id,
             assistant_msg_id,
             error_text,
             error_metadata
         )
-        error_step = AgentStep(
-            step_type="error",
-            content=error_text,
-            metadata=error_metadata
-        )
         try:
-            await state.emit(error_step.to_dict())
+            # Same shape as AgentStep.to_dict(), without the intermediate dataclass.
+            await state.emit({"step_type": "error", "content": error_text, "metadata": error_metadata})
         except Exception:
             pass
     finally:
@@ -2017,9 +2322,10 @@ async def _run_task_center_stream(request: ChatRequest, state) -> None:
     try:
         await state.emit({"stream_id": state.stream_id})
 
-        new_session_created = False
+        processed_message = message_processor.preprocess_user_message(request.message)
+        config = None
         if request.session_id:
-            session = db.get_session(request.session_id)
+            session, config, _ = await asyncio.to_thread(db.get_session_bundle, request.session_id)
             if not session:
                 raise HTTPException(status_code=404, detail="Session not found")
             if request.agent_profile is not None and request.agent_profile != getattr(session, "agent_profile", None):
@@ -2036,26 +2342,20 @@ async def _run_task_center_stream(request: ChatRequest, state) -> None:
                 else:
                     config_id = default_config.id
             session = db.create_session(ChatSessionCreate(
-                title="New Chat",
+                title=_fallback_title(processed_message),
                 config_id=config_id,
                 work_path=request.work_path,
                 agent_profile=request.agent_profile
             ))
-            new_session_created = True
             _schedule_ast_scan(session.work_path)
 
         is_first_turn = (session.message_count or 0) == 0
-        config = db.get_config(session.config_id)
+        if config is None:
+            config = db.get_config(session.config_id)
         if not config:
             raise HTTPException(status_code=404, detail="Config not found")
 
-        processed_message = message_processor.preprocess_user_message(request.message)
-        if new_session_created:
-            provisional_title = _fallback_title(processed_message)
-            if provisional_title and provisional_title != session.title:
-                db.update_session(session.id, ChatSessionUpdate(title=provisional_title))
-
-        prepared_attachments, _llm_image_urls = _collect_prepared_attachments(request.attachments)
+        prepared_attachments, _llm_image_urls = await _collect_prepared_attachments(request.attachments)
         user_msg = db.create_message(ChatMessageCreate(
             session_id=session.id,
             role="user",
@@ -2121,17 +2421,12 @@ async def _run_task_center_stream(request: ChatRequest, state) -> None:
                 await asyncio.sleep(0.2)
                 continue
 
+            step_rows: List[Tuple[str, str, int, Optional[Dict[str, Any]], str]] = []
             for event in events:
                 seq = event.seq
                 step = _task_event_to_agent_step(event, task)
 
-                db.save_agent_step(
-                    message_id=assistant_msg_id,
-                    step_type=step.step_type,
-                    content=step.content,
-                    sequence=step_sequence,
-                    metadata=step.metadata
-                )
+                step_rows.append((step.step_type, step.content, step_sequence, step.metadata, datetime.now().isoformat()))
                 if step.step_type == "action" and isinstance(step.metadata, dict) and step.metadata.get("tool"):
                     db.save_tool_call(
                         message_id=assistant_msg_id,
@@ -2152,47 +2447,34 @@ async def _run_task_center_stream(request: ChatRequest, state) -> None:
 
                 if terminal_reached:
                     break
+            await _db_write(db.save_agent_steps_bulk, assistant_msg_id, step_rows)
 
         if assistant_msg_id:
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                '''
-                UPDATE chat_messages
-                SET content = ?
-                WHERE id = ?
-                ''',
-                (final_answer, assistant_msg_id)
-            )
-            conn.commit()
-            conn.close()
+            await _db_write(db.update_message_content, assistant_msg_id, final_answer)
 
-        await _maybe_update_session_title(
+        _spawn_background(_maybe_update_session_title(
             session_id=session.id,
             config=config,
             user_message=processed_message,
             assistant_message=final_answer,
             is_first_turn=is_first_turn,
-            assistant_message_id=assistant_msg_id
-        )
+            assistant_message_id=assistant_msg_id,
+            stop_event=stop_event
+        ))
 
         await state.emit({"done": True, "session_id": session.id})
     except Exception as exc:
         error_text = f"Agent failed: {exc}"
-        error_metadata = {"error": str(exc), "traceback": traceback.format_exc()}
+        error_metadata = {"error": str(exc), "traceback": _format_agent_error_traceback(exc)}
         assistant_msg_id = _persist_agent_failure_message(
             session.id if session else None,
             assistant_msg_id,
             error_text,
             error_metadata
         )
-        error_step = AgentStep(
-            step_type="error",
-            content=error_text,
-            metadata=error_metadata
-        )
         try:
-            await state.emit(error_step.to_dict())
+            # Same shape as AgentStep.to_dict(), without the intermediate dataclass.
+            await state.emit({"step_type": "error", "content": error_text, "metadata": error_metadata})
         except Exception:
             pass
     finally:
@@ -2222,11 +2504,7 @@ async def chat_agent_stream(request: ChatRequest):
             return StreamingResponse(
                 state.stream(last_seq),
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
+                headers=SSE_HEADERS
             )
 
         keepalive_sec = _resolve_stream_keepalive_sec()
@@ -2238,11 +2516,7 @@ async def chat_agent_stream(request: ChatRequest):
         return StreamingResponse(
             state.stream(last_seq),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+            headers=SSE_HEADERS
         )
 
     except HTTPException:
@@ -2303,6 +2577,8 @@ def set_app_config(payload: Dict[str, Any]):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     after_sig = _mcp_servers_signature(updated)
+    # Subagent tool descriptions list the spawnable profiles from app config.
+    _invalidate_tools_json_cache()
     if before_sig != after_sig:
         try:
             refresh_mcp_tools()
@@ -2398,14 +2674,10 @@ async def revert_patch(request: PatchRevertRequest):
         })
         try:
             tool = ApplyPatchTool()
-            result_text = await tool.execute(json.dumps({"patch": request.revert_patch}))
+            result = await tool.execute_structured(request.revert_patch)
         finally:
             reset_tool_context(token)
-
-        try:
-            result = json.loads(result_text)
-        except Exception:
-            result = {"ok": False, "error": result_text}
+        result_text = json.dumps(result, ensure_ascii=False)
 
         if not result.get("ok"):
             detail = result.get("error", "Patch revert failed")
@@ -2429,20 +2701,17 @@ async def revert_patch(request: PatchRevertRequest):
         content="已撤销最近一次修改。"
     ))
 
-    db.save_agent_step(
-        message_id=assistant_msg.id,
-        step_type="observation",
-        content=result_text,
-        sequence=0,
-        metadata={"tool": "apply_patch" if not snapshot_restored else "snapshot_restore", "patch_event": "revert"}
-    )
-    db.save_agent_step(
-        message_id=assistant_msg.id,
-        step_type="answer",
-        content="已撤销最近一次修改。",
-        sequence=1,
-        metadata={"patch_event": "revert"}
-    )
+    timestamp = datetime.now().isoformat()
+    db.save_agent_steps_bulk(assistant_msg.id, [
+        (
+            "observation",
+            result_text,
+            0,
+            {"tool": "apply_patch" if not snapshot_restored else "snapshot_restore", "patch_event": "revert"},
+            timestamp
+        ),
+        ("answer", "已撤销最近一次修改。", 1, {"patch_event": "revert"}, timestamp),
+    ])
 
     return {
         "ok": True,
@@ -2546,11 +2815,7 @@ async def stream_pty(request: PtyStreamRequest):
     return StreamingResponse(
         state.stream(last_seq),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers=SSE_HEADERS
     )
 
 
@@ -2666,12 +2931,32 @@ def close_pty(request: PtyCloseRequest):
     closed = manager.close(request.session_id, request.pty_id)
     return {"ok": closed, "pty_id": request.pty_id}
 
+# ==================== Cache ====================
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"llm_response": llm_response_cache.stats()}
+
 # ==================== Tools ====================
 
+_TOOLS_JSON_CACHE: Optional[Tuple[int, bytes]] = None
+
+
+def _invalidate_tools_json_cache() -> None:
+    global _TOOLS_JSON_CACHE
+    _TOOLS_JSON_CACHE = None
+
+
 @app.get("/tools")
-def get_tools():
-    tools = ToolRegistry.get_all()
-    return [tool.to_dict() for tool in tools]
+async def get_tools():
+    # Encoded once per registry version; tool config and agent profile updates reset it.
+    global _TOOLS_JSON_CACHE
+    version = ToolRegistry.version()
+    if _TOOLS_JSON_CACHE is None or _TOOLS_JSON_CACHE[0] != version:
+        tools = ToolRegistry.get_all()
+        body = DEFAULT_JSON_RESPONSE([tool.to_dict() for tool in tools]).body
+        _TOOLS_JSON_CACHE = (version, body)
+    return Response(_TOOLS_JSON_CACHE[1], media_type="application/json")
 
 @app.post("/tools/ast")
 async def run_ast(request: AstRequest):
@@ -2713,7 +2998,7 @@ async def run_ast(request: AstRequest):
         if request.include_text is not None:
             payload["include_text"] = request.include_text
 
-        result_text = await tool.execute(json.dumps(payload))
+        result_text = await tool.execute_payload(payload)
     except PermissionError as exc:
         raise HTTPException(status_code=403, detail=str(exc))
     except ValueError as exc:
@@ -2723,20 +3008,69 @@ async def run_ast(request: AstRequest):
     finally:
         reset_tool_context(token)
 
+    # CodeAstTool answers with json.dumps output; pass it through instead of decoding and re-encoding it.
+    if result_text.startswith("{"):
+        return Response(content=result_text, media_type="application/json")
+    return {"ok": False, "error": result_text}
+
+AST_NOTIFY_BATCH_WINDOW_SEC = 0.005
+# Paths waiting for the next index update, keyed by root; dict keys keep them ordered and unique.
+_PENDING_AST_NOTIFY: Dict[str, Dict[str, None]] = {}
+_AST_NOTIFY_BATCH: Optional["asyncio.Future[Dict[str, Any]]"] = None
+
+
+def _run_ast_notify_batch(batch: Dict[str, List[str]]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for root, paths in batch.items():
+        try:
+            results[root] = get_ast_index().notify_paths(root, paths)
+        except Exception as exc:
+            results[root] = exc
+    return results
+
+
+async def _flush_ast_notify(batch: Dict[str, List[str]], future: "asyncio.Future[Dict[str, Any]]") -> None:
     try:
-        return json.loads(result_text)
-    except Exception:
-        return {"ok": False, "error": result_text}
+        results = await asyncio.to_thread(_run_ast_notify_batch, batch)
+    except Exception as exc:
+        results = {root: exc for root in batch}
+    if not future.done():
+        future.set_result(results)
+
+
+def _start_ast_notify_flush() -> None:
+    global _AST_NOTIFY_BATCH
+    future, _AST_NOTIFY_BATCH = _AST_NOTIFY_BATCH, None
+    batch = {root: list(paths) for root, paths in _PENDING_AST_NOTIFY.items()}
+    _PENDING_AST_NOTIFY.clear()
+    if future is not None:
+        _spawn_background(_flush_ast_notify(batch, future))
+
+
+async def _notify_ast_coalesced(root: str, paths: List[str]) -> Any:
+    """Merge notifications arriving within a short window into one index update per root."""
+    global _AST_NOTIFY_BATCH
+    pending = _PENDING_AST_NOTIFY.setdefault(root, {})
+    for path in paths:
+        pending.setdefault(path, None)
+    future = _AST_NOTIFY_BATCH
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = _AST_NOTIFY_BATCH = loop.create_future()
+        loop.call_later(AST_NOTIFY_BATCH_WINDOW_SEC, _start_ast_notify_flush)
+    # Shielded so a disconnecting client does not cancel the update for the rest of the batch.
+    results = await asyncio.shield(future)
+    return results.get(root, 0)
+
 
 @app.post("/ast/notify")
-def notify_ast(request: AstNotifyRequest):
+async def notify_ast(request: AstNotifyRequest):
     if not request.root:
         raise HTTPException(status_code=400, detail="Missing root")
-    paths = request.paths or []
-    try:
-        updated = get_ast_index().notify_paths(request.root, paths)
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"AST notify failed: {exc}")
+    updated = await _notify_ast_coalesced(request.root, request.paths or [])
+    if isinstance(updated, Exception):
+        raise HTTPException(status_code=500, detail=f"AST notify failed: {updated}")
+    # With merged requests this counts files updated for the whole batch on this root.
     return {"ok": True, "updated": updated}
 
 @app.get("/ast/settings/all")
@@ -2747,14 +3081,51 @@ def get_ast_settings_all_route():
         raise HTTPException(status_code=500, detail=f"AST settings error: {exc}")
     return {"ok": True, **data}
 
+AST_ROOT_EXISTS_TTL_SEC = 5.0
+AST_ROOT_EXISTS_MAX_ENTRIES = 256
+# Roots recently confirmed to exist; misses are never cached, so a newly created root shows up at once.
+_AST_ROOT_SEEN_AT: Dict[str, float] = {}
+
+
+def _ast_root_exists(root: str) -> bool:
+    if Path(root).expanduser().exists():
+        if len(_AST_ROOT_SEEN_AT) >= AST_ROOT_EXISTS_MAX_ENTRIES:
+            _AST_ROOT_SEEN_AT.clear()
+        _AST_ROOT_SEEN_AT[root] = time.monotonic()
+        return True
+    _AST_ROOT_SEEN_AT.pop(root, None)
+    return False
+
+
+def _ast_root_recently_seen(root: str) -> bool:
+    seen_at = _AST_ROOT_SEEN_AT.get(root)
+    return seen_at is not None and time.monotonic() - seen_at < AST_ROOT_EXISTS_TTL_SEC
+
+
+def _dump_ast_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _iter_ast_cache_listing(root: str, entries: List[Dict[str, Any]], ast_enabled: bool):
+    # Same document as the non-streamed listing: {"ok", "root", "files": [...], "disabled"}.
+    yield b'{"ok":true,"root":' + _dump_ast_json(root) + b',"files":['
+    separator = b""
+    for entry in entries:
+        yield separator + _dump_ast_json(entry)
+        separator = b","
+    yield b'],"disabled":' + (b"false" if ast_enabled else b"true") + b"}"
+
+
 @app.get("/ast/settings")
-def get_ast_settings_route(root: str = Query(...)):
+async def get_ast_settings_route(root: str = Query(...)):
     if not root:
         raise HTTPException(status_code=400, detail="Missing root")
-    if not Path(root).expanduser().exists():
+    if not (_ast_root_recently_seen(root) or await asyncio.to_thread(_ast_root_exists, root)):
         raise HTTPException(status_code=404, detail="Root path not found")
     try:
-        settings = get_ast_settings(root)
+        settings = await asyncio.to_thread(get_ast_settings, root)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"AST settings error: {exc}")
     return {"ok": True, "root": settings.get("root"), "settings": settings}
@@ -2763,7 +3134,7 @@ def get_ast_settings_route(root: str = Query(...)):
 def update_ast_settings_route(request: AstSettingsRequest):
     if not request.root:
         raise HTTPException(status_code=400, detail="Missing root")
-    if not Path(request.root).expanduser().exists():
+    if not _ast_root_exists(request.root):
         raise HTTPException(status_code=404, detail="Root path not found")
     patch = request.dict(exclude={"root"}, exclude_none=True)
     try:
@@ -2777,21 +3148,27 @@ def update_ast_settings_route(request: AstSettingsRequest):
     return {"ok": True, "root": settings.get("root"), "settings": settings}
 
 @app.get("/ast/cache")
-def get_ast_cache(root: str = Query(...), path: Optional[str] = None, include_payload: bool = False):
+async def get_ast_cache(root: str = Query(...), path: Optional[str] = None, include_payload: bool = False):
     if not root:
         raise HTTPException(status_code=400, detail="Missing root")
-    if not Path(root).expanduser().exists():
+    if not (_ast_root_recently_seen(root) or await asyncio.to_thread(_ast_root_exists, root)):
         raise HTTPException(status_code=404, detail="Root path not found")
     try:
-        app_config = get_app_config()
-        agent_cfg = app_config.get("agent", {}) if isinstance(app_config, dict) else {}
-        ast_enabled = bool(agent_cfg.get("ast_enabled", True))
+        ast_enabled = get_app_config_view().ast_enabled
         if path:
-            payload = get_ast_index().get_file_payload(root, path)
+            payload = await asyncio.to_thread(get_ast_index().get_file_payload, root, path)
             if isinstance(payload, dict) and not ast_enabled:
                 payload.setdefault("disabled", True)
             return payload
-        entries = get_ast_index().get_root_entries(root, include_payload=include_payload)
+        if include_payload:
+            # Entries (stats, index lock) are built here so failures still become a 500; only the
+            # encoding of the large payloads is streamed.
+            entries = await asyncio.to_thread(get_ast_index().get_root_entries, root, include_payload=True)
+            return StreamingResponse(
+                _iter_ast_cache_listing(root, entries, ast_enabled),
+                media_type="application/json"
+            )
+        entries = await asyncio.to_thread(get_ast_index().get_root_entries, root)
         return {"ok": True, "root": root, "files": entries, "disabled": not ast_enabled}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"AST cache error: {exc}")
@@ -2802,7 +3179,7 @@ def get_code_map(session_id: str = Query(...), root: str = Query(...)):
         raise HTTPException(status_code=400, detail="Missing session_id")
     if not root:
         raise HTTPException(status_code=400, detail="Missing root")
-    if not Path(root).expanduser().exists():
+    if not (_ast_root_recently_seen(root) or _ast_root_exists(root)):
         raise HTTPException(status_code=404, detail="Root path not found")
     session = db.get_session(session_id)
     if not session:
@@ -2817,7 +3194,7 @@ def get_code_map(session_id: str = Query(...), root: str = Query(...)):
 async def stop_chat(request: ChatStopRequest):
     message_id = request.message_id
     if message_id is None and request.session_id:
-        message_id = db.get_latest_assistant_message_id(request.session_id)
+        message_id = await asyncio.to_thread(db.get_latest_assistant_message_id, request.session_id)
     if message_id is None:
         raise HTTPException(status_code=400, detail="Missing message_id or session_id")
     stopped = stream_stop_registry.stop(int(message_id))
@@ -2828,11 +3205,11 @@ async def stop_chat(request: ChatStopRequest):
         except Exception:
             pass
     print(f"[STREAM STOP] message_id={message_id} stopped={stopped}")
-    return {"stopped": stopped, "message_id": message_id}
+    return DEFAULT_JSON_RESPONSE({"stopped": stopped, "message_id": message_id})
 
 @app.get("/tools/config")
-def get_tools_config():
-    return get_tool_config()
+async def get_tools_config():
+    return DEFAULT_JSON_RESPONSE(get_tool_config())
 
 @app.put("/tools/config")
 def set_tools_config(payload: Dict[str, Any]):
@@ -2842,31 +3219,107 @@ def set_tools_config(payload: Dict[str, Any]):
         raise HTTPException(status_code=400, detail=str(e))
     ToolRegistry.clear()
     register_builtin_tools()
+    _invalidate_tools_json_cache()
     return updated
 
 @app.get("/tools/permissions", response_model=List[ToolPermissionRequest])
-def get_tool_permissions(status: Optional[str] = None):
-    return db.get_permission_requests(status=status)
+async def get_tool_permissions(status: Optional[str] = None):
+    return await asyncio.to_thread(db.get_permission_requests, status=status)
+
+SHELL_ALLOWLIST_FLUSH_DELAY_SEC = 0.25
+# Approved commands waiting to be written to the allowlist, keyed by lowercased name.
+_PENDING_SHELL_ALLOW: Dict[str, str] = {}
+_SHELL_ALLOW_FLUSH_HANDLE: Optional[asyncio.TimerHandle] = None
+_SHELL_ALLOW_FLUSH_TASK: Optional[asyncio.Task] = None
+# Resolved once the pending batch has been written; approvals in the batch wait on it.
+_SHELL_ALLOW_BATCH: Optional["asyncio.Future[None]"] = None
+# The allowlist write is a read-modify-write of the tool config, so batches must not overlap.
+_SHELL_ALLOW_WRITE_LOCK = asyncio.Lock()
+
+
+def _write_shell_allowlist_additions(names: List[str]) -> None:
+    allowset = get_shell_allowset("allowlist")
+    additions = [name for name in names if name.lower() not in allowset]
+    if not additions:
+        return
+    allowlist = list(get_tool_config().get("shell", {}).get("allowlist", []) or [])
+    allowlist.extend(additions)
+    update_tool_config({"shell": {"allowlist": allowlist}})
+
+
+def _take_pending_shell_allowlist() -> Tuple[List[str], Optional["asyncio.Future[None]"]]:
+    global _SHELL_ALLOW_FLUSH_HANDLE, _SHELL_ALLOW_BATCH
+    if _SHELL_ALLOW_FLUSH_HANDLE is not None:
+        _SHELL_ALLOW_FLUSH_HANDLE.cancel()
+        _SHELL_ALLOW_FLUSH_HANDLE = None
+    names = list(_PENDING_SHELL_ALLOW.values())
+    _PENDING_SHELL_ALLOW.clear()
+    batch, _SHELL_ALLOW_BATCH = _SHELL_ALLOW_BATCH, None
+    return names, batch
+
+
+async def _flush_shell_allowlist(names: List[str], batch: Optional["asyncio.Future[None]"]) -> None:
+    try:
+        async with _SHELL_ALLOW_WRITE_LOCK:
+            await asyncio.to_thread(_write_shell_allowlist_additions, names)
+    except Exception as exc:
+        print(f"[Shell Allowlist] Failed to add {names}: {exc}")
+    finally:
+        if batch is not None and not batch.done():
+            batch.set_result(None)
+
+
+def _start_shell_allowlist_flush() -> None:
+    global _SHELL_ALLOW_FLUSH_TASK
+    names, batch = _take_pending_shell_allowlist()
+    _SHELL_ALLOW_FLUSH_TASK = _spawn_background(_flush_shell_allowlist(names, batch))
+
+
+async def _queue_shell_allowlist_addition(cmd_name: str) -> None:
+    """Add cmd_name to the shell allowlist, batching approvals that arrive during a write.
+
+    An isolated approval is written at once. Approvals that arrive while a write is running
+    are debounced into one follow-up batch, so a burst rewrites the tool config only twice.
+    Returns after the batch holding cmd_name has been written, so the approval response still
+    means the command is allowlisted.
+    """
+    global _SHELL_ALLOW_FLUSH_HANDLE, _SHELL_ALLOW_BATCH
+    _PENDING_SHELL_ALLOW.setdefault(cmd_name.lower(), cmd_name)
+    if _SHELL_ALLOW_BATCH is None:
+        loop = asyncio.get_running_loop()
+        batch = _SHELL_ALLOW_BATCH = loop.create_future()
+        if _SHELL_ALLOW_FLUSH_TASK is None or _SHELL_ALLOW_FLUSH_TASK.done():
+            _start_shell_allowlist_flush()
+        else:
+            _SHELL_ALLOW_FLUSH_HANDLE = loop.call_later(
+                SHELL_ALLOWLIST_FLUSH_DELAY_SEC,
+                _start_shell_allowlist_flush
+            )
+    else:
+        batch = _SHELL_ALLOW_BATCH
+    await asyncio.shield(batch)
+
 
 @app.put("/tools/permissions/{request_id}", response_model=ToolPermissionRequest)
-def update_tool_permission(request_id: int, update: ToolPermissionRequestUpdate):
-    updated = db.update_permission_request(request_id, update.status)
+async def update_tool_permission(request_id: int, update: ToolPermissionRequestUpdate):
+    updated = await asyncio.to_thread(db.update_permission_request, request_id, update.status)
     if not updated:
         raise HTTPException(status_code=404, detail="Permission request not found")
     if update.status == "approved" and updated.get("tool_name") == "run_shell":
         cmd_name = _extract_command_name(updated.get("path") or "")
-        if cmd_name:
-            cfg = get_tool_config()
-            allowlist = list(cfg.get("shell", {}).get("allowlist", []) or [])
-            allowset = {str(item).lower() for item in allowlist}
-            if cmd_name.lower() not in allowset:
-                allowlist.append(cmd_name)
-                try:
-                    update_tool_config({"shell": {"allowlist": allowlist}})
-                except Exception:
-                    pass
+        if cmd_name and cmd_name.lower() not in get_shell_allowset("allowlist"):
+            await _queue_shell_allowlist_addition(cmd_name)
     return updated
 
+
+def _resolve_event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+    except Exception:
+        return "asyncio"
+    return "uvloop"
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Tauri Agent Backend")
     parser.add_argument("--host", default="127.0.0.1")
@@ -2876,4 +3329,8 @@ if __name__ == "__main__":
     print("Starting FastAPI server...")
     print("Supported LLMs: OpenAI, ZhipuAI, Deepseek")
     print(f"Database: SQLite ({os.getenv('TAURI_AGENT_DB_PATH', 'chat_app.db')})")
-    uvicorn.run(app, host=args.host, port=args.port, reload=args.reload)
+    event_loop = _resolve_event_loop()
+    print(f"Event loop: {event_loop}")
+    # Always a single process: the stream, stop, PTY and allowlist registries are in-memory, so
+    # stream resume and /chat/stop must reach the worker that owns the stream.
+    uvicorn.run(app, host=args.host, port=args.port, reload=args.reload, loop=event_loop, http="auto")
@@ -49,21 +49,10 @@ class MessageProcessor:
         Returns:
             格式化的消息列表
         """
-        messages = []
-        
-        # 添加系统提示词
-        if system_prompt:
-            messages.append({"role": system_role, "content": system_prompt})
-        
-        # 添加历史消息（限制数量）
-        if history:
-            recent_history = history[-max_history:] if len(history) > max_history else history
-            messages.extend(recent_history)
-        
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": user_message})
-        
-        return messages
+        # 系统提示词 + 最近的历史消息（限制数量）+ 当前用户消息，直接切片拼接
+        system_messages = [{"role": system_role, "content": system_prompt}] if system_prompt else []
+        recent_history = history[-max_history:] if history else []
+        return system_messages + recent_history + [{"role": "user", "content": user_message}]
     
     @staticmethod
     def postprocess_llm_response(content: str) -> str:
@@ -3,39 +3,100 @@ import json
 import os
 import time
 import uuid
+from types import MappingProxyType
 from typing import Any, Dict, List, Optional, Tuple
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 
 DEFAULT_KEEPALIVE_SEC = 15
 DEFAULT_MAX_EVENTS = 2000
 DEFAULT_TTL_SEC = 600
+DEFAULT_COALESCE_MS = 10
+SSE_COALESCE_MAX_BYTES = 16 * 1024
 
 
-def _get_int_env(name: str, fallback: int) -> int:
+def _get_int_env(name: str, fallback: int, minimum: int = 1) -> int:
     raw = os.getenv(name)
     if raw is None:
         return fallback
     try:
         value = int(raw)
-        return value if value > 0 else fallback
+        return value if value >= minimum else fallback
     except (TypeError, ValueError):
         return fallback
 
 
+def _dumps_json(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+_SSE_DATA_PREFIX = b"data: "
+_SSE_FRAME_END = b"\n\n"
+_SSE_CONTENT_PREFIX = b'data: {"content":'
+_SSE_CONTENT_END = b"}\n\n"
+_SSE_JOIN = b"".join
+
+
+def encode_sse_data(payload: Dict[str, Any], seq: Optional[int] = None) -> bytes:
+    """Encode a payload as a complete SSE `data:` frame, optionally appending a `seq` field.
+
+    When seq is given the payload must not carry its own "seq" key; the field is spliced into
+    the encoded bytes, so a second one would be emitted as a duplicate key.
+    """
+    body = _dumps_json(payload)
+    if seq is None:
+        return _SSE_JOIN((_SSE_DATA_PREFIX, body, _SSE_FRAME_END))
+    if "seq" in payload:
+        raise ValueError("payload already carries a seq field")
+    # Append rather than copy the dict.
+    seq_field = b'"seq":%d}' % seq if body == b"{}" else b',"seq":%d}' % seq
+    return _SSE_JOIN((_SSE_DATA_PREFIX, memoryview(body)[:-1], seq_field, _SSE_FRAME_END))
+
+
+def encode_sse_content(content: str) -> bytes:
+    """Encode a `{"content": ...}` delta frame; same bytes as encode_sse_data, without building the dict."""
+    if orjson is not None:
+        try:
+            return _SSE_JOIN((_SSE_CONTENT_PREFIX, orjson.dumps(content), _SSE_CONTENT_END))
+        except TypeError:
+            pass
+    return encode_sse_data({"content": content})
+
+
+SSE_KEEPALIVE_FRAME = b":\n\n"
+# Shared by every SSE response; read-only so no handler can mutate it for the others.
+SSE_HEADERS = MappingProxyType({
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+})
+
+
 class StreamState:
     def __init__(
         self,
         stream_id: str,
         keepalive_sec: int,
         max_events: int,
-        ttl_sec: int
+        ttl_sec: int,
+        coalesce_ms: int = DEFAULT_COALESCE_MS
     ) -> None:
         self.stream_id = stream_id
         self.keepalive_sec = int(keepalive_sec or DEFAULT_KEEPALIVE_SEC)
         self.max_events = int(max_events or DEFAULT_MAX_EVENTS)
         self.ttl_sec = int(ttl_sec or DEFAULT_TTL_SEC)
+        self.coalesce_sec = max(0, int(coalesce_ms or 0)) / 1000.0
         self._seq = 0
-        self._events: List[Tuple[int, str]] = []
+        self._events: List[Tuple[int, bytes]] = []
         self._init_payload: Optional[Dict[str, Any]] = None
         self._lock = asyncio.Lock()
         self._cond = asyncio.Condition()
@@ -55,10 +116,7 @@ class StreamState:
     async def emit(self, payload: Dict[str, Any]) -> int:
         async with self._lock:
             self._seq += 1
-            payload = dict(payload)
-            payload["seq"] = self._seq
-            encoded = json.dumps(payload, ensure_ascii=False)
-            self._events.append((self._seq, encoded))
+            self._events.append((self._seq, encode_sse_data(payload, seq=self._seq)))
             if len(self._events) > self.max_events:
                 self._events = self._events[-self.max_events :]
             self.last_activity = time.monotonic()
@@ -82,7 +140,7 @@ class StreamState:
         async with self._cond:
             self._cond.notify_all()
 
-    async def _snapshot_since(self, last_seq: int) -> Tuple[List[Tuple[int, str]], int, bool]:
+    async def _snapshot_since(self, last_seq: int) -> Tuple[List[Tuple[int, bytes]], int, bool]:
         async with self._lock:
             events = [(seq, data) for seq, data in self._events if seq > last_seq]
             latest_seq = self._seq
@@ -97,20 +155,35 @@ class StreamState:
                 if self._init_payload:
                     init_payload = dict(self._init_payload)
             if init_payload:
-                encoded = json.dumps(init_payload, ensure_ascii=False)
-                yield f"data: {encoded}\n\n"
+                yield encode_sse_data(init_payload)
         while True:
             events, latest_seq, done = await self._snapshot_since(cursor)
-            for seq, data in events:
+            # Send everything that piled up in as few writes as possible.
+            batch: List[bytes] = []
+            batch_size = 0
+            for seq, frame in events:
                 cursor = seq
-                yield f"data: {data}\n\n"
+                batch.append(frame)
+                batch_size += len(frame)
+                if batch_size >= SSE_COALESCE_MAX_BYTES:
+                    yield b"".join(batch)
+                    batch = []
+                    batch_size = 0
+            if batch:
+                yield b"".join(batch)
             if done and cursor >= latest_seq:
                 return
             try:
                 async with self._cond:
                     await asyncio.wait_for(self._cond.wait(), timeout=self.keepalive_sec)
             except asyncio.TimeoutError:
-                yield ":\n\n"
+                yield SSE_KEEPALIVE_FRAME
+                continue
+            if self.coalesce_sec and len(events) > 1 and not self._done:
+                # The last snapshot held several frames, so a token burst is under way: give the
+                # next frames a moment to land in the same write. A first token or a lone frame
+                # after a pause goes out without the delay.
+                await asyncio.sleep(self.coalesce_sec)
 
 
 class StreamRegistry:
@@ -121,6 +194,8 @@ class StreamRegistry:
         self._cleanup_interval_sec = 30.0
         self._ttl_sec = _get_int_env("AGENT_STREAM_TTL_SEC", DEFAULT_TTL_SEC)
         self._max_events = _get_int_env("AGENT_STREAM_MAX_EVENTS", DEFAULT_MAX_EVENTS)
+        # 0 turns coalescing off.
+        self._coalesce_ms = _get_int_env("AGENT_STREAM_COALESCE_MS", DEFAULT_COALESCE_MS, minimum=0)
 
     async def create(self, keepalive_sec: int) -> StreamState:
         await self._maybe_cleanup()
@@ -129,7 +204,8 @@ class StreamRegistry:
             stream_id=stream_id,
             keepalive_sec=keepalive_sec,
             max_events=self._max_events,
-            ttl_sec=self._ttl_sec
+            ttl_sec=self._ttl_sec,
+            coalesce_ms=self._coalesce_ms
         )
         async with self._lock:
             self._streams[stream_id] = state
@@ -0,0 +1,69 @@
+import math
+import re
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+TITLE_CACHE_MAX_ENTRIES = 256
+TITLE_CACHE_SIMILARITY = 0.92
+TITLE_CACHE_TEXT_CHARS = 400
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", (text or "").strip().lower())[:TITLE_CACHE_TEXT_CHARS]
+
+
+def _trigram_vector(text: str) -> Tuple[Dict[str, int], float]:
+    padded = f"  {text} "
+    grams = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    norm = math.sqrt(sum(count * count for count in grams.values()))
+    return grams, norm
+
+
+def _cosine(left: Tuple[Dict[str, int], float], right: Tuple[Dict[str, int], float]) -> float:
+    left_grams, left_norm = left
+    right_grams, right_norm = right
+    if not left_norm or not right_norm:
+        return 0.0
+    if len(left_grams) > len(right_grams):
+        left_grams, right_grams = right_grams, left_grams
+    dot = sum(count * right_grams.get(gram, 0) for gram, count in left_grams.items())
+    return dot / (left_norm * right_norm)
+
+
+class TitleSimilarityCache:
+    """Reuse generated titles for near-duplicate opening messages (character trigram cosine)."""
+
+    def __init__(self, max_entries: int = TITLE_CACHE_MAX_ENTRIES, threshold: float = TITLE_CACHE_SIMILARITY) -> None:
+        self._entries: Deque[Tuple[str, Tuple[Dict[str, int], float], str]] = deque(maxlen=max_entries)
+        self._threshold = threshold
+
+    def lookup(self, scope: str, user_message: str) -> Optional[str]:
+        text = _normalize_text(user_message)
+        if not text:
+            return None
+        vector = _trigram_vector(text)
+        best_title = None
+        best_score = self._threshold
+        for entry_scope, entry_vector, title in self._entries:
+            if entry_scope != scope:
+                continue
+            score = _cosine(vector, entry_vector)
+            if score >= best_score:
+                best_score = score
+                best_title = title
+        return best_title
+
+    def add(self, scope: str, user_message: str, title: str) -> None:
+        text = _normalize_text(user_message)
+        if not text or not title:
+            return
+        self._entries.append((scope, _trigram_vector(text), title))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+title_similarity_cache = TitleSimilarityCache()
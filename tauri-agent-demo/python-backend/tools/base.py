@@ -158,6 +158,7 @@ class ToolRegistry:
     """
     
     _tools: Dict[str, Tool] = {}
+    _version: int = 0
     
     @classmethod
     def register(cls, tool: Tool):
@@ -173,6 +174,7 @@ class ToolRegistry:
         if tool.name in cls._tools:
             raise ValueError(f"Tool '{tool.name}' already registered")
         cls._tools[tool.name] = tool
+        cls._version += 1
     
     @classmethod
     def unregister(cls, tool_name: str):
@@ -184,6 +186,7 @@ class ToolRegistry:
         """
         if tool_name in cls._tools:
             del cls._tools[tool_name]
+            cls._version += 1
     
     @classmethod
     def get(cls, tool_name: str) -> Optional[Tool]:
@@ -220,6 +223,12 @@ class ToolRegistry:
     def clear(cls):
         """Clear all registered tools (mainly for testing)"""
         cls._tools.clear()
+        cls._version += 1
+
+    @classmethod
+    def version(cls) -> int:
+        """Counter bumped whenever the set of registered tools changes."""
+        return cls._version
     
     @classmethod
     def list_names(cls) -> List[str]:
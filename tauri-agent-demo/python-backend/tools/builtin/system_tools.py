@@ -17,7 +17,7 @@ from typing import Any, Dict, Tuple, Optional, List, Set
 import httpx
 
 from ..base import Tool, ToolParameter
-from ..config import get_tool_config, update_tool_config
+from ..config import get_tool_config, update_tool_config, get_shell_allowset
 from ..context import get_tool_context
 from ..pty_manager import (
     get_pty_manager,
@@ -38,6 +38,8 @@ try:
 except Exception:
     posix_pty = None
 
+# First token as shlex.split(posix=False) yields it: a quoted string up to its closing quote, else a word.
+_COMMAND_FIRST_TOKEN_RE = re.compile(r"""[ \t\r\n]*("[^"]*"|'[^']*'|[^ \t\r\n]+)""")
 _ANSI_ESCAPE_RE = re.compile(r"[\u001b\u009b][\\[\]()#;?]*(?:[0-9]{1,4}(?:;[0-9]{0,4})*)?[@-~]")
 _INTERACTIVE_PROMPT_PATTERNS = [
     re.compile(r"use\s+arrow\s+keys", re.IGNORECASE),
@@ -492,13 +494,10 @@ def _apply_patch_text(patch_text: str) -> Dict[str, Any]:
 def _extract_command_name(command: str) -> str:
     if not command:
         return ""
-    try:
-        parts = shlex.split(command, posix=False)
-    except Exception:
-        parts = command.strip().split()
-    if not parts:
+    match = _COMMAND_FIRST_TOKEN_RE.match(command)
+    if not match:
         return ""
-    first = parts[0].strip().strip('"').strip("'")
+    first = match.group(1).strip().strip('"').strip("'")
     base = os.path.basename(first).lower()
     if base.endswith(".exe") or base.endswith(".cmd") or base.endswith(".bat"):
         base = os.path.splitext(base)[0]
@@ -2933,13 +2932,9 @@ def _start_windows_unrestricted_pipe_persistent(
 
 
 def _ensure_shell_allowlist_entry(command_name: str) -> None:
-    if not command_name:
-        return
-    config = get_tool_config()
-    allowlist = list(config.get("shell", {}).get("allowlist", []) or [])
-    allowset = {str(item).lower() for item in allowlist}
-    if command_name.lower() in allowset:
+    if not command_name or command_name.lower() in get_shell_allowset("allowlist"):
         return
+    allowlist = list(get_tool_config().get("shell", {}).get("allowlist", []) or [])
     allowlist.append(command_name)
     try:
         update_tool_config({"shell": {"allowlist": allowlist}})
@@ -2948,13 +2943,9 @@ def _ensure_shell_allowlist_entry(command_name: str) -> None:
 
 
 def _ensure_shell_unrestricted_allowlist_entry(command_name: str) -> None:
-    if not command_name:
-        return
-    config = get_tool_config()
-    allowlist = list(config.get("shell", {}).get("unrestricted_allowlist", []) or [])
-    allowset = {str(item).lower() for item in allowlist}
-    if command_name.lower() in allowset:
+    if not command_name or command_name.lower() in get_shell_allowset("unrestricted_allowlist"):
         return
+    allowlist = list(get_tool_config().get("shell", {}).get("unrestricted_allowlist", []) or [])
     allowlist.append(command_name)
     try:
         update_tool_config({"shell": {"unrestricted_allowlist": allowlist}})
@@ -3684,10 +3675,8 @@ class RunShellTool(Tool):
         tool_ctx = get_tool_context()
         agent_mode = _get_agent_mode()
         shell_unrestricted = bool(tool_ctx.get("shell_unrestricted"))
-        allowlist = get_tool_config().get("shell", {}).get("allowlist", [])
-        allowset = {str(item).lower() for item in allowlist}
-        unrestricted_allowlist = get_tool_config().get("shell", {}).get("unrestricted_allowlist", [])
-        unrestricted_allowset = {str(item).lower() for item in unrestricted_allowlist}
+        allowset = get_shell_allowset("allowlist")
+        unrestricted_allowset = get_shell_allowset("unrestricted_allowlist")
 
         reasons = []
         if agent_mode != "super":
@@ -4129,12 +4118,17 @@ class ApplyPatchTool(Tool):
         patch_text = data.get("patch") or input_data
         if not patch_text:
             raise ValueError("Missing patch content.")
+        return json.dumps(await self.execute_structured(patch_text), ensure_ascii=False)
+
+    async def execute_structured(self, patch_text: str) -> Dict[str, Any]:
+        """Apply patch_text and return the result dict, skipping the JSON round-trip of execute()."""
+        if not patch_text:
+            return {"ok": False, "error": "Missing patch content."}
         try:
             _maybe_create_snapshot()
-            result = _apply_patch_text(patch_text)
-            return json.dumps(result, ensure_ascii=False)
+            return _apply_patch_text(patch_text)
         except Exception as e:
-            return json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False)
+            return {"ok": False, "error": str(e)}
 
 
 class TavilySearchTool(Tool):
@@ -4915,7 +4909,13 @@ class CodeAstTool(Tool):
 
     async def execute(self, input_data: str) -> str:
         data = _parse_json_input(input_data)
-        path = data.get("path") or input_data
+        if not data.get("path"):
+            data["path"] = input_data
+        return await self.execute_payload(data)
+
+    async def execute_payload(self, data: Dict[str, Any]) -> str:
+        """Run on an already-parsed request dict; in-process callers skip the JSON encode/decode."""
+        path = data.get("path")
         if not path:
             raise ValueError("Missing path.")
         app_cfg = get_app_config()
@@ -1,7 +1,7 @@
 import json
 import os
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet
 
 
 _DEFAULT_CONFIG: Dict[str, Any] = {
@@ -126,6 +126,7 @@ def _load_config() -> Dict[str, Any]:
 
 
 _TOOL_CONFIG = _load_config()
+_SHELL_ALLOWSETS: Dict[str, FrozenSet[str]] = {}
 
 
 def get_tool_config() -> Dict[str, Any]:
@@ -142,9 +143,20 @@ def update_tool_config(patch: Dict[str, Any]) -> Dict[str, Any]:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(merged_file, ensure_ascii=False, indent=2), encoding="utf-8")
     _TOOL_CONFIG = _load_config()
+    _SHELL_ALLOWSETS.clear()
     return _TOOL_CONFIG
 
 
+def get_shell_allowset(key: str = "allowlist") -> FrozenSet[str]:
+    """Lowercased entries of a shell allowlist, rebuilt only after a config update."""
+    allowset = _SHELL_ALLOWSETS.get(key)
+    if allowset is None:
+        entries = get_tool_config().get("shell", {}).get(key, []) or []
+        allowset = frozenset(str(item).lower() for item in entries)
+        _SHELL_ALLOWSETS[key] = allowset
+    return allowset
+
+
 def is_tool_enabled(name: str) -> bool:
     enabled = get_tool_config().get("enabled", {})
     return bool(enabled.get(name, False))
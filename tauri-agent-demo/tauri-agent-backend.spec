@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['uvicorn.loops.uvloop', 'uvicorn.protocols.http.httptools_impl', 'httptools', 'uvloop'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
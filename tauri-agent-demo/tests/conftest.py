@@ -1,7 +1,32 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[1]
 PY_BACKEND = ROOT / 'python-backend'
 if str(PY_BACKEND) not in sys.path:
     sys.path.insert(0, str(PY_BACKEND))
+
+from database import Database  # noqa: E402
+from models import ChatSessionCreate, LLMConfigCreate  # noqa: E402
+
+
+@pytest.fixture
+def create_seed_session():
+    """Factory that adds a config plus a session to a Database and returns the session id."""
+
+    def _create(test_db: Database, title: str = "s") -> str:
+        cfg = test_db.create_config(
+            LLMConfigCreate(
+                name="test",
+                api_profile="openai",
+                api_format="openai_chat_completions",
+                api_key="k",
+                model="gpt-4o-mini",
+            )
+        )
+        session = test_db.create_session(ChatSessionCreate(title=title, config_id=cfg.id))
+        return session.id
+
+    return _create
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMResponseCache
+from llm_client import LLMRequestStopped
+from models import LLMConfig
+
+
+def _config(temperature: float = 0.0) -> LLMConfig:
+    return LLMConfig(name="test", api_key="k", model="gpt-4o-mini", temperature=temperature)
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_make_key_skips_non_deterministic_requests() -> None:
+    cache = LLMResponseCache()
+    assert cache.make_key(_config(0.7), MESSAGES, "chat") is None
+    forced = cache.make_key(_config(0.7), MESSAGES, "chat", force=True)
+    assert forced is not None
+
+    key = cache.make_key(_config(0.0), MESSAGES, "chat")
+    assert key == cache.make_key(_config(0.0), list(MESSAGES), "chat")
+    assert key != cache.make_key(_config(0.0), MESSAGES, "title")
+
+
+def test_hit_and_expiry(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = LLMResponseCache(ttl=10.0)
+    cache.set("k", {"content": "hi", "raw_response": {"id": 1}, "llm_call_id": 7})
+
+    hit = cache.get("k")
+    assert hit == {"content": "hi", "raw_response": {"id": 1}}
+    hit["raw_response"]["id"] = 2
+    assert cache.get("k")["raw_response"] == {"id": 1}
+    assert cache.hits == 2
+
+    now[0] += 11.0
+    assert cache.get("k") is None
+    assert cache.misses == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_follower_shares_leader_result() -> None:
+    async def scenario() -> None:
+        cache = LLMResponseCache()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"content": "answer", "raw_response": None, "llm_call_id": 42}
+
+        leader = asyncio.create_task(cache.get_or_fetch("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_fetch("k", fetch))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert (await leader)["llm_call_id"] == 42
+        assert await follower == {"content": "answer", "raw_response": None}
+        assert calls == 1
+        assert cache.coalesced == 1
+
+    asyncio.run(scenario())
+
+
+def test_follower_inherits_leader_failure() -> None:
+    async def scenario() -> None:
+        cache = LLMResponseCache()
+        release = asyncio.Event()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        leader = asyncio.create_task(cache.get_or_fetch("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_fetch("k", fetch))
+        await asyncio.sleep(0)
+        release.set()
+
+        for task in (leader, follower):
+            with pytest.raises(RuntimeError, match="upstream down"):
+                await task
+        assert calls == 1
+        assert cache.get("k") is None
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("leader_outcome", ["cancelled", "stopped"])
+def test_follower_refetches_when_leader_is_cancelled_or_stopped(leader_outcome: str) -> None:
+    async def scenario() -> None:
+        cache = LLMResponseCache()
+        leader_started = asyncio.Event()
+        stop_leader = asyncio.Event()
+
+        async def leader_fetch():
+            leader_started.set()
+            await stop_leader.wait()
+            raise LLMRequestStopped("Request stopped")
+
+        async def follower_fetch():
+            return {"content": "fresh", "raw_response": None, "llm_call_id": 9}
+
+        leader = asyncio.create_task(cache.get_or_fetch("k", leader_fetch))
+        await leader_started.wait()
+        follower = asyncio.create_task(cache.get_or_fetch("k", follower_fetch))
+        await asyncio.sleep(0)
+
+        if leader_outcome == "cancelled":
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+        else:
+            stop_leader.set()
+            with pytest.raises(LLMRequestStopped):
+                await leader
+
+        # The follower ran its own fetch, so it owns the resulting call id.
+        assert await follower == {"content": "fresh", "raw_response": None, "llm_call_id": 9}
+        assert cache.get("k") == {"content": "fresh", "raw_response": None}
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,138 @@
+import sqlite3
+from pathlib import Path
+
+import database
+from database import Database
+from models import ChatMessageCreate
+
+
+def _count_sessions(test_db: Database) -> int:
+    conn = test_db.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+    conn.close()
+    return count
+
+
+def _is_closed(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_release_rolls_back_uncommitted_work(tmp_path: Path, create_seed_session) -> None:
+    test_db = Database(str(tmp_path / "pool_rollback.sqlite"))
+    create_seed_session(test_db)
+    before = _count_sessions(test_db)
+
+    conn = test_db.get_connection()
+    conn.execute("DELETE FROM chat_sessions")
+    assert conn.in_transaction
+    conn.close()
+
+    reused = test_db.get_connection()
+    assert reused is conn
+    assert not reused.in_transaction
+    reused.close()
+    assert _count_sessions(test_db) == before
+
+
+def test_double_close_is_noop(tmp_path: Path) -> None:
+    test_db = Database(str(tmp_path / "pool_double_close.sqlite"))
+    test_db.close_connections()
+
+    conn = test_db.get_connection()
+    conn.close()
+    conn.close()
+
+    # Pooled once, not twice: the second checkout has to open a new connection.
+    reused = test_db.get_connection()
+    other = test_db.get_connection()
+    assert reused is conn
+    assert other is not conn
+    assert reused.execute("SELECT 1").fetchone()[0] == 1
+    reused.close()
+    other.close()
+
+
+def test_pool_is_capped(tmp_path: Path) -> None:
+    test_db = Database(str(tmp_path / "pool_cap.sqlite"))
+    test_db.close_connections()
+    total = database.SQLITE_POOL_SIZE + 2
+
+    conns = [test_db.get_connection() for _ in range(total)]
+    assert len({id(conn) for conn in conns}) == total
+    for conn in conns:
+        conn.close()
+
+    kept, overflow = conns[:database.SQLITE_POOL_SIZE], conns[database.SQLITE_POOL_SIZE:]
+    assert not any(_is_closed(conn) for conn in kept)
+    assert all(_is_closed(conn) for conn in overflow)
+
+    again = [test_db.get_connection() for _ in range(total)]
+    reused = [conn for conn in again if any(conn is old for old in kept)]
+    assert len(reused) == database.SQLITE_POOL_SIZE
+    for conn in again:
+        conn.close()
+
+
+def test_close_connections_closes_idle(tmp_path: Path) -> None:
+    test_db = Database(str(tmp_path / "pool_close_all.sqlite"))
+    conn = test_db.get_connection()
+    conn.close()
+    assert not _is_closed(conn)
+
+    test_db.close_connections()
+    assert _is_closed(conn)
+
+    fresh = test_db.get_connection()
+    assert fresh is not conn
+    assert fresh.execute("SELECT 1").fetchone()[0] == 1
+    fresh.close()
+
+
+def test_get_messages_for_export_groups_by_session(tmp_path: Path, monkeypatch, create_seed_session) -> None:
+    test_db = Database(str(tmp_path / "export.sqlite"))
+    first = create_seed_session(test_db, "first")
+    second = create_seed_session(test_db, "second")
+    empty = create_seed_session(test_db, "empty")
+    test_db.create_message(ChatMessageCreate(session_id=first, role="user", content="q1"))
+    test_db.create_message(ChatMessageCreate(session_id=second, role="user", content="q2"))
+    test_db.create_message(ChatMessageCreate(session_id=first, role="assistant", content="a1"))
+
+    # A tiny chunk size exercises the IN (...) batching.
+    monkeypatch.setattr(database, "SQLITE_MAX_IN_PARAMS", 1)
+    grouped = test_db.get_messages_for_export([first, second, empty])
+
+    assert list(grouped) == [first, second, empty]
+    assert [(m["role"], m["content"]) for m in grouped[first]] == [("user", "q1"), ("assistant", "a1")]
+    assert [m["content"] for m in grouped[second]] == ["q2"]
+    assert grouped[empty] == []
+    assert all(set(m) == {"role", "content", "timestamp"} for m in grouped[first])
+    assert test_db.get_messages_for_export([]) == {}
+
+
+def test_save_agent_steps_bulk(tmp_path: Path, create_seed_session) -> None:
+    test_db = Database(str(tmp_path / "steps.sqlite"))
+    session_id = create_seed_session(test_db)
+    message = test_db.create_message(ChatMessageCreate(session_id=session_id, role="assistant", content=""))
+
+    test_db.save_agent_steps_bulk(message.id, [])
+    assert test_db.get_agent_steps(message.id) == []
+
+    test_db.save_agent_steps_bulk(
+        message.id,
+        [
+            ("thought", "thinking", 1, None, "2026-01-01T00:00:01"),
+            ("action", "run", 0, {"tool": "shell"}, "2026-01-01T00:00:00"),
+        ],
+    )
+    steps = test_db.get_agent_steps(message.id)
+    assert [(s["sequence"], s["step_type"], s["content"]) for s in steps] == [
+        (0, "action", "run"),
+        (1, "thought", "thinking"),
+    ]
+    assert steps[0]["metadata"] == {"tool": "shell"}
+    assert steps[1]["metadata"] == {}
+    assert [s["timestamp"] for s in steps] == ["2026-01-01T00:00:00", "2026-01-01T00:00:01"]
@@ -1,39 +1,25 @@
 from pathlib import Path
 
 from database import Database
-from models import ChatSessionCreate, LLMConfigCreate, TaskStatus
+from models import TaskStatus
 
 
-def _create_seed_session(test_db: Database) -> str:
-    cfg = test_db.create_config(
-        LLMConfigCreate(
-            name="test",
-            api_profile="openai",
-            api_format="openai_chat_completions",
-            api_key="k",
-            model="gpt-4o-mini",
-        )
-    )
-    session = test_db.create_session(ChatSessionCreate(title="s", config_id=cfg.id))
-    return session.id
-
-
-def test_migration_up_down_up_idempotent(tmp_path: Path) -> None:
+def test_migration_up_down_up_idempotent(tmp_path: Path, create_seed_session) -> None:
     db_path = tmp_path / "m1.sqlite"
     test_db = Database(str(db_path))
     test_db.migrate_agent_tasks_down()
     test_db.migrate_agent_tasks_up()
     test_db.migrate_agent_tasks_up()
 
-    session_id = _create_seed_session(test_db)
+    session_id = create_seed_session(test_db)
     instance = test_db.upsert_agent_instance(session_id, "default", abilities=["a"])
     assert instance.session_id == session_id
 
 
-def test_task_crud_and_event_seq(tmp_path: Path) -> None:
+def test_task_crud_and_event_seq(tmp_path: Path, create_seed_session) -> None:
     db_path = tmp_path / "m1_crud.sqlite"
     test_db = Database(str(db_path))
-    session_id = _create_seed_session(test_db)
+    session_id = create_seed_session(test_db)
     instance = test_db.upsert_agent_instance(session_id, "default", abilities=["tools_all"])
 
     task = test_db.create_agent_task(
@@ -73,10 +59,10 @@ def test_task_crud_and_event_seq(tmp_path: Path) -> None:
     assert any(item.id == task.id for item in listed)
 
 
-def test_transaction_create_task_with_initial_event(tmp_path: Path) -> None:
+def test_transaction_create_task_with_initial_event(tmp_path: Path, create_seed_session) -> None:
     db_path = tmp_path / "m1_tx.sqlite"
     test_db = Database(str(db_path))
-    session_id = _create_seed_session(test_db)
+    session_id = create_seed_session(test_db)
     instance = test_db.upsert_agent_instance(session_id, "default", abilities=[])
 
     task = test_db.create_agent_task(
@@ -0,0 +1,60 @@
+import os
+import shlex
+
+import pytest
+
+from tools.builtin import system_tools
+
+
+def _reference_command_name(command: str) -> str:
+    # The shlex-based tokenizer that _COMMAND_FIRST_TOKEN_RE replaced.
+    if not command:
+        return ""
+    try:
+        parts = shlex.split(command, posix=False)
+    except Exception:
+        parts = command.strip().split()
+    if not parts:
+        return ""
+    first = parts[0].strip().strip('"').strip("'")
+    base = os.path.basename(first).lower()
+    if base.endswith(".exe") or base.endswith(".cmd") or base.endswith(".bat"):
+        base = os.path.splitext(base)[0]
+    return base
+
+
+COMMANDS = [
+    "",
+    "   ",
+    "ls -la",
+    "  \t\r\n ls -la",
+    "Git.EXE status",
+    "/usr/bin/python3 -c 'print(1)'",
+    '"C:/Program Files/Git/bin/git.exe" status',
+    "'/opt/my tools/run.sh' --flag",
+    'C:\\Windows\\System32\\cmd.exe /c dir',
+    '"a"b c',
+    "'a'b c",
+    'a"b c" d',
+    '"unbalanced foo',
+    "'unbalanced foo",
+    'foo "unbalanced',
+    '""',
+    "'' rm -rf /",
+    "#comment",
+    "ls #comment",
+    "a#b c",
+    "rm;ls",
+    "echo&&rm",
+    "build.bat",
+    "setup.cmd --quiet",
+]
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_extract_command_name_matches_shlex(command: str) -> None:
+    import main as backend_main
+
+    expected = _reference_command_name(command)
+    assert system_tools._extract_command_name(command) == expected
+    assert backend_main._extract_command_name(command) == expected
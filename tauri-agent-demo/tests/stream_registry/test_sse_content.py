@@ -0,0 +1,25 @@
+import pytest
+
+import stream_registry
+from stream_registry import encode_sse_content, encode_sse_data
+
+CONTENTS = [
+    "",
+    "hello",
+    "你好，世界 👋",
+    "tab\tnew\nline\rcr \x00 \x1f \x7f",
+    "quote \" backslash \\ slash /",
+    "line\u2028separator\u2029",
+    "  ",
+]
+
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_encode_sse_content_matches_encode_sse_data(content: str) -> None:
+    assert encode_sse_content(content) == encode_sse_data({"content": content})
+
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_encode_sse_content_without_orjson(content: str, monkeypatch) -> None:
+    monkeypatch.setattr(stream_registry, "orjson", None)
+    assert encode_sse_content(content) == encode_sse_data({"content": content})
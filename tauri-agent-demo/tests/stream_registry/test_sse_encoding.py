@@ -0,0 +1,28 @@
+import pytest
+
+from stream_registry import encode_sse_data
+
+orjson = pytest.importorskip("orjson")
+
+
+def _frame(payload) -> bytes:
+    return b"data: " + orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {},
+        {"content": "hi"},
+        {"content": "你好 \"quoted\"\n", "done": False, "nested": {"a": [1, 2]}},
+    ],
+)
+def test_encode_sse_data_seq_matches_merged_dict(payload) -> None:
+    assert encode_sse_data(payload) == _frame(payload)
+    assert encode_sse_data(payload, seq=7) == _frame({**payload, "seq": 7})
+
+
+def test_encode_sse_data_rejects_payload_with_seq() -> None:
+    with pytest.raises(ValueError):
+        encode_sse_data({"seq": 1}, seq=2)
+    assert encode_sse_data({"seq": 1}) == _frame({"seq": 1})